@@ -2,19 +2,45 @@ from __future__ import absolute_import
 
 from .timer import Timer
 from .report import Report
-
-import pxul.os
-from pxul.subprocess import run
+from . import checkpoint as ckpt
 
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 import copy
 import os
 import shutil
+import time
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+################################################## lazy imports
+
+# pxul is only needed once a phase runs, so importing this module
+# (e.g. in every worker process) does not pay for it.
+
+def _env(**kws):
+    """Context manager setting the environment, see :func:`pxul.os.env`
+    """
+
+    import pxul.os
+    return pxul.os.env(**kws)
+
+
+def _subprocess(*args, **kws):
+    """Run a subprocess, see :func:`pxul.subprocess.run`
+    """
+
+    from pxul.subprocess import run
+    return run(*args, **kws)
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
 ################################################## exceptions
 
 class BenchmarkError(Exception):
@@ -70,6 +96,18 @@ class AbstractBenchmarkRunner:
 
 
     The resultant ``times.txt`` can then be processed to generate figures.
+
+    Long runs can be made resumable by passing a checkpoint file:
+
+    .. python:
+
+       bench = MyBenchmarkRunner(checkpoint='bench.json')
+       bench.bench(times=20)
+
+    If the controller dies, calling :func:`bench` again with the same
+    checkpoint skips the trials that completed with the same
+    configuration and calls :func:`_recover` on any trial that was
+    interrupted.
     """
 
 
@@ -77,23 +115,46 @@ class AbstractBenchmarkRunner:
 
 
     def __init__(self, prefix=None, node_count=1, data_params=None,
-                 files_to_source=None, provider_name=None):
+                 files_to_source=None, provider_name=None, checkpoint=None,
+                 concurrency=32, isolation=None, metrics_port=None):
         """
         :param prefix: directory (created if missing) to fetch projects into
         :param node_count: number of nodes to launch
         :param data_params: size (in bytes) of the dataset to generate (if None -- the default -- do not do anything for dataset size)
         :param files_to_source: paths to files to source for environment
         :param provider_name: name of the cloud provider
+        :param checkpoint: path to a file recording the progress of :func:`bench` (if None -- the default -- trials are not checkpointed)
+        :param concurrency: maximum number of nodes :func:`fan_out` works on at once
+        :param isolation: how to isolate the phases that run locally and fingerprint the machine for each trial (if None -- the default -- do neither)
+        :type isolation: :class:`cloudmesh_bench_api.noise.Isolation`
+        :param metrics_port: serve live metrics on this port of localhost during :func:`bench` (if None -- the default -- do not serve), see :class:`cloudmesh_bench_api.metrics.MetricsServer`
         """
         self._prefix = prefix or os.getcwd()
         self._env = dict()
         self.__log = list()
         self.__timer = Timer()
-        self._report = Report(self.__timer)
+        self._report = Report(self.__timer, node_count=node_count)
         self._node_count = node_count
         self._data_params = data_params
         self._files_to_source = files_to_source or list()
         self._provider_name = provider_name or ''
+        self._checkpoint = ckpt.Checkpoint(checkpoint) if checkpoint else None
+        self._record = None
+        self._restored = set()
+        self._next_trial = 0
+        self._trial = None
+        self._path = None
+        self._shell = None
+        self._concurrency = concurrency
+        self._fanout = None
+        self._base_env = None
+        self._isolation = isolation
+        self._metrics_port = metrics_port
+        self._progress = dict(total=0, completed=0, resumed=0, started=None)
+
+        if isinstance(data_params, (int, long, float)):
+            for name in ['dataset', 'run']:
+                self._report.set_work(name, data_params, unit='bytes')
 
     ################################################## fetch
 
@@ -131,7 +192,7 @@ class AbstractBenchmarkRunner:
         if prefix is None:
             prefix = os.getcwd()
 
-        with self._timer.measure('fetch'):
+        with self._timer.measure('fetch', trial=self._trial):
             path = self._fetch(prefix)
 
         self._path = path
@@ -183,16 +244,19 @@ class AbstractBenchmarkRunner:
         """
 
         self._log.append('prepare')
+        self._close_shell()
 
         cmds = ['source %s' % p for p in self.files_to_source]
-        with self._timer.measure('prepare'):
+        with self._isolated('prepare'), \
+             self._timer.measure('prepare', trial=self._trial):
             self._env = self.eval_bash(cmds)
             newenv    = self._prepare()
             self._env.update(newenv)
 
         if self.generate_dataset:
             self._log.append('dataset')
-            with self._timer.measure('dataset'):
+            with self._isolated('dataset'), \
+                 self._timer.measure('dataset', trial=self._trial):
                 direct = self._generate_data(self.data_params)
                 method = 'directly' if direct else 'deferred'
                 logger.info('Data generated %s', method)
@@ -219,7 +283,8 @@ class AbstractBenchmarkRunner:
 
         self._log.append('configure')
 
-        with pxul.os.env(**self._env),  self._timer.measure('configure'):
+        with _env(**self._env), self._isolated('configure'), \
+             self._timer.measure('configure', trial=self._trial):
             self._configure(node_count=self.node_count)
                 
 
@@ -239,7 +304,7 @@ class AbstractBenchmarkRunner:
 
         self._log.append('launch')
 
-        with pxul.os.env(**self._env), self._timer.measure('launch'):
+        with _env(**self._env), self._timer.measure('launch', trial=self._trial):
             self._launch()
 
 
@@ -259,7 +324,7 @@ class AbstractBenchmarkRunner:
 
         self._log.append('deploy')
 
-        with pxul.os.env(**self._env), self._timer.measure('deploy'):
+        with _env(**self._env), self._timer.measure('deploy', trial=self._trial):
             self._deploy()
 
 
@@ -279,7 +344,7 @@ class AbstractBenchmarkRunner:
 
         self._log.append('run')
 
-        with pxul.os.env(**self._env), self._timer.measure('run'):
+        with _env(**self._env), self._timer.measure('run', trial=self._trial):
             self._run()
 
 
@@ -306,7 +371,8 @@ class AbstractBenchmarkRunner:
 
         self._log.append('verify')
 
-        with pxul.os.env(**self._env), self._timer.measure('verify'):
+        with _env(**self._env), self._isolated('verify'), \
+             self._timer.measure('verify', trial=self._trial):
             passed = self._verify()
 
         if not passed:
@@ -329,22 +395,40 @@ class AbstractBenchmarkRunner:
 
         self._log.append('clean')
 
-        with pxul.os.env(**self._env), self._timer.measure('cleanup'):
+        with _env(**self._env), self._timer.measure('cleanup', trial=self._trial):
             try:
                 self._clean()
             except BenchmarkError as e:
                 logger.error('Cleaning failed with %s', e)
             finally:
+                self._close_shell()
+                self._close_fanout()
                 shutil.rmtree(self.path)
                 self._path = None
 
     ################################################## bench
 
-    def bench(self, times=1):
+    def bench(self, times=1, lookahead=0):
         """Run the entire benchmark
 
+        If a checkpoint is used, trials that already completed with
+        the current configuration count towards ``times`` and are not
+        run again.
+
+        With a ``lookahead``, the phases of different trials overlap
+        as long as they do not need the same resource (see
+        :attr:`resources`).  For instance, the next trial may be
+        fetched and prepared while the current one runs, but two
+        trials never use the cluster at once.  As the process has a
+        single environment, only phases not in :attr:`environ_phases`
+        overlap those of other trials, and by default that is none of
+        them.  Each trial runs on a copy of this runner with its own
+        ``prefix/trial-<index>`` directory.
+
         :param times: the number of times to run
         :type times: :class:`int` greater than zero
+        :param lookahead: how many trials may be started ahead of the one using the cluster (0, the default, runs trials one after the other)
+        :type lookahead: :class:`int`
         """
 
         if times < 1:
@@ -354,21 +438,314 @@ class AbstractBenchmarkRunner:
 
         self._log.append('bench(times={})'.format(times))
 
-        for i in xrange(times):
+        done = self._resume()
+        if done:
+            logger.info('Resuming after %d completed trials', done)
+
+        self._progress.update(total     = times,
+                              completed = done,
+                              resumed   = done,
+                              started   = time.time())
+
+        if self._metrics_port is None:
+            self._bench(times - done, lookahead)
+        else:
+            from .metrics import MetricsServer
+            with MetricsServer(self, port=self._metrics_port):
+                self._bench(times - done, lookahead)
+
+
+    def _bench(self, count, lookahead):
+        if lookahead > 0:
+            self._bench_pipelined(count, lookahead)
+            return
+
+        for i in xrange(count):
+            self._begin_trial()
+            status = ckpt.FAILED
+
             self.fetch(prefix=self._prefix)
             self.prepare()
+            self._checkpoint_update(path=self.path, env=self._env)
             self.configure()
 
             try:
                 self.launch()
                 self.deploy()
                 self.run()
+                status = ckpt.COMPLETED
             except BenchmarkError as e:
                 logger.error(str(e))
             finally:
                 self.clean()
+                self._end_trial(status)
+
+
+    ################################################## pipelining
+
+    #: The resource each phase of :func:`bench` uses when trials are
+    #: pipelined.  Subclasses may override this, for instance if
+    #: fetching only copies from a local mirror.  The ``local`` phases
+    #: are the ones run under :class:`cloudmesh_bench_api.noise.Isolation`.
+    resources = dict(fetch     = 'network',
+                     prepare   = 'local',
+                     dataset   = 'local',
+                     configure = 'local',
+                     verify    = 'local',
+                     launch    = 'cluster',
+                     deploy    = 'cluster',
+                     run       = 'cluster',
+                     clean     = 'cluster')
+
+    #: The number of phases that may use each resource at once
+    capacities = dict(network = 1,
+                      local   = 1,
+                      cluster = 1)
+
+    #: The phases that set or read :data:`os.environ`.  As the process
+    #: has a single environment, these also use the ``environ``
+    #: resource, of which there is one, so that each only sees the
+    #: environment of its own trial.  By default this is every phase,
+    #: so pipelined trials do not overlap; subclasses whose ``_fetch``
+    #: and ``_prepare`` do not depend on the environment may leave out
+    #: ``fetch``, ``prepare``, and ``dataset`` to overlap them with
+    #: the cluster phases of other trials.
+    environ_phases = frozenset(['fetch', 'prepare', 'dataset', 'configure',
+                                'launch', 'deploy', 'run', 'verify', 'clean'])
+
+
+    def _fork(self, index):
+        """A copy of this runner to run a single trial.
+
+        The copy shares the timer, log, and checkpoint, but has its
+        own prefix, path, environment, shell, and connections.  Its
+        :func:`eval_bash` starts from the environment at the time of
+        forking rather than :data:`os.environ`, which other trials may
+        be changing.
+        """
+
+        trial = copy.copy(self)
+        trial._trial = index
+        trial._prefix = os.path.join(self._prefix, 'trial-%d' % index)
+        trial._env = dict()
+        trial._path = None
+        trial._shell = None
+        trial._fanout = None
+        trial._record = None
+        trial._base_env = dict(os.environ)
+        return trial
+
+
+    def _bench_pipelined(self, count, lookahead):
+        from .scheduler import Scheduler
+
+        scheduler = Scheduler(dict(self.capacities, environ=1))
+        trials = list()
+
+        for i in xrange(count):
+            trial = self._fork(self._next_trial)
+            self._next_trial += 1
+            trials.append(self._schedule_trial(scheduler, i, trial, lookahead))
+
+        try:
+            scheduler.run()
+        except Exception:
+            for state in trials:
+                if state['begun'] and not state['cleaned']:
+                    self._abandon_trial(state)
+            raise
+
+
+    def _abandon_trial(self, state):
+        """Clean up a pipelined trial stopped by an error, and record
+        it as failed.  A trial that was fetched but not launched only
+        has its benchmark directory removed.
+        """
+
+        trial = state['runner']
+        try:
+            if state['launched']:
+                trial.clean()
+            elif trial.path and os.path.exists(trial.path):
+                shutil.rmtree(trial.path)
+        finally:
+            state['cleaned'] = True
+            trial._end_trial(ckpt.FAILED)
+            trial._remove_prefix()
+
+
+    def _remove_prefix(self):
+        if os.path.isdir(self._prefix) and not os.listdir(self._prefix):
+            os.rmdir(self._prefix)
 
 
+    def _schedule_trial(self, scheduler, i, trial, lookahead):
+        """Add the phases of the ``i``\ th pipelined trial to the scheduler
+
+        :returns: the state of the trial
+        :rtype: :class:`dict`
+        """
+
+        state = dict(runner=trial, begun=False, failed=False, launched=False,
+                     cleaned=False)
+
+        def fetch():
+            trial._begin_trial(trial._trial)
+            state['begun'] = True
+            trial.fetch(prefix=trial._prefix)
+
+        def prepare():
+            trial.prepare()
+            trial._checkpoint_update(path=trial.path, env=trial._env)
+
+        def cluster(phase):
+            def task():
+                state['launched'] = True
+                if state['failed']:
+                    return
+                try:
+                    phase()
+                except BenchmarkError as e:
+                    logger.error(str(e))
+                    state['failed'] = True
+            return task
+
+        def clean():
+            try:
+                trial.clean()
+            finally:
+                state['cleaned'] = True
+                status = ckpt.FAILED if state['failed'] else ckpt.COMPLETED
+                trial._end_trial(status)
+                trial._remove_prefix()
+
+        ahead = [(i - lookahead, 'launch')] if i >= lookahead else []
+        previous = [(i - 1, 'clean')] if i > 0 else []
+
+        phases = [('fetch',     fetch,                  ahead),
+                  ('prepare',   prepare,                [(i, 'fetch')]),
+                  ('configure', trial.configure,        [(i, 'prepare')]),
+                  ('launch',    cluster(trial.launch),  [(i, 'configure')] + previous),
+                  ('deploy',    cluster(trial.deploy),  [(i, 'launch')]),
+                  ('run',       cluster(trial.run),     [(i, 'deploy')]),
+                  ('clean',     clean,                  [(i, 'run')])]
+
+        for name, fn, deps in phases:
+            resources = [self.resources[name]]
+            if name in self.environ_phases:
+                resources.append('environ')
+            scheduler.add((i, name), fn, resource=resources, deps=deps)
+
+        return state
+
+
+    ################################################## isolation
+
+    def _isolated(self, phase):
+        """Context manager isolating a phase if it runs locally
+        """
+
+        if self._isolation is not None and self.resources.get(phase) == 'local':
+            return self._isolation()
+        else:
+            return _nothing()
+
+
+    def _fingerprint(self):
+        """Record the state of the machine for the current trial
+        """
+
+        if self._isolation is None:
+            return
+
+        fingerprint = self._isolation.fingerprint()
+        self._report.set_fingerprint(self._trial, fingerprint)
+        self._checkpoint_update(fingerprint=fingerprint)
+
+
+    ################################################## checkpoint
+
+    def _recover(self, trial):
+        """Cleanup after a trial that was interrupted before finishing.
+
+        This is called by :func:`bench` when resuming from a
+        checkpoint.  The default removes the fetched benchmark;
+        subclasses should extend this to tear down anything that may
+        have been left running, such as the virtual cluster.
+
+        :param trial: the trial record, see :mod:`cloudmesh_bench_api.checkpoint`
+        :type trial: :class:`dict`
+        """
+
+        path = trial['path']
+        if path and os.path.exists(path):
+            shutil.rmtree(path)
+
+
+    def _resume(self):
+        """Restore completed trials from the checkpoint and recover
+        interrupted ones.
+
+        :returns: the number of completed trials with the current configuration
+        :rtype: :class:`int`
+        """
+
+        if self._checkpoint is None:
+            return 0
+
+        for trial in self._checkpoint.interrupted():
+            logger.warning('Recovering interrupted trial %d', trial['index'])
+            self._log.append('recover')
+            with _env(**trial['env']):
+                try:
+                    self._recover(trial)
+                except BenchmarkError as e:
+                    logger.error('Recovering failed with %s', e)
+            self._checkpoint.finish(trial, ckpt.RECOVERED, [])
+
+        completed = self._checkpoint.completed(self._config)
+        for trial in completed:
+            if trial['index'] in self._restored:
+                continue
+            for name, start, stop in trial['timings']:
+                self._timer.record(name, start, stop, trial=trial['index'])
+            if trial.get('fingerprint'):
+                self._report.set_fingerprint(trial['index'], trial['fingerprint'])
+            self._restored.add(trial['index'])
+
+        self._next_trial = max(self._next_trial, self._checkpoint.next_index)
+        return len(completed)
+
+
+    def _begin_trial(self, index=None):
+        if index is None:
+            index = self._next_trial
+            self._next_trial += 1
+
+        self._trial = index
+
+        if self._checkpoint is not None:
+            self._record = self._checkpoint.begin(self._trial, self._config)
+
+        self._fingerprint()
+
+
+    def _checkpoint_update(self, **kwargs):
+        if self._checkpoint is not None:
+            self._checkpoint.update(self._record, **kwargs)
+
+
+    def _end_trial(self, status):
+        self._progress['completed'] += 1
+
+        if self._checkpoint is not None:
+            timings = self._timer.spans(trial=self._trial)
+            self._checkpoint.finish(self._record, status, timings)
+            self._restored.add(self._trial)
+            self._record = None
+
+        self._trial = None
+
 
     ##################################################
 
@@ -418,6 +795,10 @@ class AbstractBenchmarkRunner:
     def report(self):
         """Generate a report
 
+        If ``data_params`` is a number of bytes, it is used as the work
+        of the ``dataset`` and ``run`` phases.  Subclasses may set the
+        work of other phases with :func:`Report.set_work`.
+
         :returns: a report object
         :rtype: :class:`Report`
         """
@@ -425,6 +806,32 @@ class AbstractBenchmarkRunner:
         return self._report
 
 
+    @property
+    def progress(self):
+        """The progress of :func:`bench`:
+
+        - ``total``: the number of trials to run
+        - ``completed``: the number of trials finished, including resumed ones
+        - ``elapsed``: seconds since :func:`bench` started
+        - ``eta``: estimated seconds until all trials are finished (None until a trial finishes)
+
+        :rtype: :class:`dict`
+        """
+
+        p = self._progress
+        elapsed = time.time() - p['started'] if p['started'] else None
+        finished = p['completed'] - p['resumed']
+
+        eta = None
+        if finished > 0:
+            eta = elapsed / finished * (p['total'] - p['completed'])
+
+        return dict(total     = p['total'],
+                    completed = p['completed'],
+                    elapsed   = elapsed,
+                    eta       = eta)
+
+
     @property
     def node_count(self):
         """Number of nodes to allocate for this benchmark
@@ -436,6 +843,19 @@ class AbstractBenchmarkRunner:
         return self._node_count
 
 
+    @property
+    def _config(self):
+        """The configuration identifying equivalent trials
+
+        :rtype: :class:`dict`
+        """
+
+        return dict(node_count      = self._node_count,
+                    data_params     = self._data_params,
+                    files_to_source = self._files_to_source,
+                    provider_name   = self._provider_name)
+
+
     @property
     def files_to_source(self):
         """The list of files to source when setting of the environment
@@ -448,6 +868,109 @@ class AbstractBenchmarkRunner:
         return copy.deepcopy(self._files_to_source)
 
 
+    def shell(self, command, check=True, name='shell'):
+        """Run a command in a persistent shell.
+
+        The shell is started on first use in the benchmark directory
+        with the benchmark environment, after sourcing
+        :func:`files_to_source`.  It is reused until the next
+        :func:`prepare` or :func:`clean`, so that state such as the
+        working directory persists between calls.  The time taken by
+        each command is recorded with the timer under ``name``.
+
+        .. python:
+
+           def _deploy(self):
+             self.shell('ansible-playbook -i inventory.txt site.yml')
+
+        :param command: the command to run
+        :type command: :class:`str`
+        :param check: raise if the command fails
+        :param name: the timer name to record the time under (None to not record)
+        :returns: the result of the command
+        :rtype: :class:`cloudmesh_bench_api.shell.Result`
+        :raises: :class:`BenchmarkError` if ``check`` and the command fails
+        """
+
+        from .shell import Shell, ShellError
+
+        try:
+            if self._shell is None:
+                self._shell = Shell(env             = self._env or None,
+                                    files_to_source = self._files_to_source,
+                                    cwd             = self._path,
+                                    timer           = self._timer,
+                                    trial           = self._trial)
+
+            if check:
+                return self._shell.check(command, name=name)
+            else:
+                return self._shell(command, name=name)
+
+        except ShellError as e:
+            raise BenchmarkError(str(e))
+
+
+    def _close_shell(self):
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
+
+
+    def _connect(self, node):
+        """Open a connection to a node for :func:`fan_out`.
+
+        Connections are reused by all calls to :func:`fan_out` until
+        :func:`clean`, when they are closed by calling their ``close``
+        method if they have one.  The default does not use
+        connections.
+
+        :param node: the node, as passed to :func:`fan_out`
+        :returns: the connection
+        """
+
+        return None
+
+
+    def fan_out(self, name, fn, nodes, raise_on_failure=True):
+        """Run an operation on many nodes concurrently.
+
+        At most ``concurrency`` nodes are worked on at once.  The time
+        each node took is recorded with the timer under ``name``.
+
+        .. python:
+
+           def _deploy(self):
+             self.fan_out('deploy.node',
+                          lambda node, ssh: ssh.run('./install.sh'),
+                          self._nodes)
+
+        :param name: the timer name to record each node's time under
+        :param fn: called as ``fn(node, connection)``, see :func:`_connect`
+        :param nodes: the nodes to run on
+        :param raise_on_failure: raise if the operation failed on any node
+        :returns: the outcome for each node
+        :rtype: :class:`cloudmesh_bench_api.fanout.FanOutResult`
+        :raises: :class:`cloudmesh_bench_api.fanout.FanOutError` (a :class:`BenchmarkError`) on failure
+        """
+
+        from .fanout import FanOut
+
+        if self._fanout is None:
+            self._fanout = FanOut(connect     = self._connect,
+                                  concurrency = self._concurrency,
+                                  timer       = self._timer)
+
+        return self._fanout.map(fn, nodes, name=name, trial=self._trial,
+                                raise_on_failure=raise_on_failure)
+
+
+    def _close_fanout(self):
+        if self._fanout is not None:
+            self._fanout.close()
+            self._fanout = None
+
+
     def eval_bash(self, commands):
         """Return a new environment obtained by evaluating these commands
 
@@ -461,8 +984,13 @@ class AbstractBenchmarkRunner:
         cmds += ['env']
         script = '\n'.join(cmds)
 
+        cmd = ['bash', '-c', script]
+        if self._base_env is not None:
+            base = ['%s=%s' % kv for kv in sorted(self._base_env.iteritems())]
+            cmd = ['env', '-i'] + base + cmd
+
         new_env = dict()
-        result = run(['bash', '-c', script], capture='stdout')
+        result = _subprocess(cmd, capture='stdout')
 
         for l in result.out.split('\n'):
             line = l.strip()
@@ -0,0 +1,218 @@
+
+"""
+Persist the progress of :func:`AbstractBenchmarkRunner.bench` so that
+an interrupted run can be resumed.
+
+Each trial is stored as a record with the following keys:
+
+- ``index``: the position of the trial
+- ``config``: the configuration of the runner that ran the trial
+- ``status``: one of ``started``, ``completed``, ``failed``, or ``recovered``
+- ``path``: where the benchmark was fetched to
+- ``env``: the environment of the benchmark
+- ``timings``: list of ``[name, start, stop]`` for the trial
+
+As the environment usually comes from sourcing files such as an
+OpenStack ``openrc``, the checkpoint may hold credentials.  It is
+therefore only readable by its owner.
+"""
+
+from __future__ import absolute_import
+
+import json
+import os
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+STARTED = 'started'
+COMPLETED = 'completed'
+FAILED = 'failed'
+RECOVERED = 'recovered'
+
+
+def normalize(config):
+    """Return the configuration as it would be read back from the
+    checkpoint, so that configurations can be compared for equality.
+
+    Values that cannot be represented in JSON are stored using their
+    :func:`repr`.
+
+    :param config: the configuration
+    :type config: :class:`dict`
+    :rtype: :class:`dict`
+    """
+
+    return json.loads(json.dumps(config, sort_keys=True, default=repr))
+
+
+class Checkpoint(object):
+    """
+    A file-backed record of the trials of a benchmark.
+
+    The file is rewritten atomically after each change, so that
+    killing the controller at any point leaves a readable checkpoint.
+    Trials running concurrently may share a checkpoint.
+
+    .. python:
+
+       checkpoint = Checkpoint('bench.json')
+       record = checkpoint.begin(config)
+       ...
+       checkpoint.finish(record, COMPLETED, timings)
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the file to store the checkpoint in (created if missing)
+        :type path: :class:`str`
+        """
+
+        self._path = path
+        self._trials = self._load()
+        self._lock = threading.RLock()
+
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return list()
+
+        with open(self._path) as fd:
+            data = json.load(fd)
+
+        return data['trials']
+
+
+    def save(self):
+        """Write the checkpoint to disk, readable only by the owner
+        since the environments it holds may contain secrets
+        """
+
+        directory = os.path.dirname(os.path.abspath(self._path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmp = self._path + '.tmp'
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+
+        with self._lock:
+            # a file left by a crash may have other permissions
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+            with os.fdopen(os.open(tmp, flags, 0o600), 'w') as fd:
+                json.dump(dict(trials=self._trials), fd, indent=2,
+                          sort_keys=True)
+                fd.flush()
+                os.fsync(fd.fileno())
+                os.rename(tmp, self._path)
+
+
+    @property
+    def path(self):
+        """
+        :returns: the path to the checkpoint file
+        :rtype: :class:`str`
+        """
+
+        return self._path
+
+
+    @property
+    def trials(self):
+        """
+        :returns: all trial records in the order they were started
+        :rtype: :class:`list` of :class:`dict`
+        """
+
+        return list(self._trials)
+
+
+    @property
+    def next_index(self):
+        """
+        :returns: the index to use for the next trial
+        :rtype: :class:`int`
+        """
+
+        with self._lock:
+            return 1 + max([t['index'] for t in self._trials] or [-1])
+
+
+    def completed(self, config):
+        """The trials which completed with the given configuration
+
+        :param config: the configuration of the runner
+        :type config: :class:`dict`
+        :rtype: :class:`list` of :class:`dict`
+        """
+
+        config = normalize(config)
+        return [t for t in self._trials
+                if t['status'] == COMPLETED and t['config'] == config]
+
+
+    def interrupted(self):
+        """The trials which were started but never finished.
+
+        These may have left resources (such as a virtual cluster)
+        behind, regardless of the configuration they were started with.
+
+        :rtype: :class:`list` of :class:`dict`
+        """
+
+        return [t for t in self._trials if t['status'] == STARTED]
+
+
+    def begin(self, index, config):
+        """Record the start of a trial
+
+        :param index: the index of the trial
+        :param config: the configuration of the runner
+        :returns: the trial record
+        :rtype: :class:`dict`
+        """
+
+        record = dict(index   = index,
+                      config  = normalize(config),
+                      status  = STARTED,
+                      path    = None,
+                      env     = dict(),
+                      timings = list())
+        with self._lock:
+            self._trials.append(record)
+            self.save()
+
+        return record
+
+
+    def update(self, record, **kwargs):
+        """Update the fields of a trial record
+
+        :param record: the trial record
+        :param kwargs: the fields to update
+        """
+
+        with self._lock:
+            record.update(kwargs)
+            self.save()
+
+
+    def finish(self, record, status, timings):
+        """Record the end of a trial
+
+        :param record: the trial record
+        :param status: the final status of the trial
+        :param timings: iterable of (name, :class:`TimeSpan`) pairs
+        """
+
+        assert status in (COMPLETED, FAILED, RECOVERED), status
+
+        timings = [[name, span.start, span.stop] for name, span in timings]
+
+        with self._lock:
+            record['status'] = status
+            record['timings'] = timings
+            self.save()
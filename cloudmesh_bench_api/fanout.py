@@ -0,0 +1,190 @@
+
+"""
+Run an operation on many nodes at once.
+
+.. python:
+
+   with FanOut(connect=ssh_connect, concurrency=64, timer=timer) as fanout:
+     fanout.map(lambda node, ssh: ssh.exec_command('uptime'), nodes,
+                name='deploy.node')
+
+Connections are opened at most once per node and reused by later calls
+to :func:`FanOut.map` until :func:`FanOut.close`.
+"""
+
+from __future__ import absolute_import
+
+from .bench import BenchmarkError
+from .timer import TimeSpan
+
+from Queue import Queue, Empty
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FanOutError(BenchmarkError):
+    """The operation failed on some of the nodes
+    """
+
+    def __init__(self, result):
+        msg = 'Failed on {} of {} nodes: {}'.format(
+            len(result.errors), len(result.nodes),
+            ', '.join('{} ({})'.format(n, e) for n, e in result.errors.items()))
+        super(FanOutError, self).__init__(msg)
+        self.result = result
+
+
+class FanOutResult(object):
+    """The outcome of running an operation on several nodes
+    """
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        self.results = dict()
+        self.errors = dict()
+        self.spans = dict()
+
+    @property
+    def ok(self):
+        """The nodes the operation succeeded on, in order
+
+        :rtype: :class:`list`
+        """
+        return [n for n in self.nodes if n not in self.errors]
+
+    @property
+    def failed(self):
+        """The nodes the operation failed on, in order
+
+        :rtype: :class:`list`
+        """
+        return [n for n in self.nodes if n in self.errors]
+
+
+class FanOut(object):
+    """
+    A bounded pool of threads running per-node operations with pooled
+    connections.
+    """
+
+    def __init__(self, connect=None, concurrency=32, timer=None):
+        """
+        :param connect: callable opening a connection to a node (default: no connections)
+        :param concurrency: maximum number of nodes to work on at once
+        :param timer: if given, record the time each node took
+        :type timer: :class:`Timer`
+        """
+
+        if concurrency < 1:
+            raise ValueError('Concurrency less than 1: {}'.format(concurrency))
+
+        self._connect = connect
+        self._concurrency = concurrency
+        self._timer = timer
+        self._connections = dict()
+        self._lock = threading.Lock()
+
+
+    def connection(self, node):
+        """The pooled connection to a node, opened if needed
+
+        :returns: the connection, or None if there is no ``connect``
+        """
+
+        if self._connect is None:
+            return None
+
+        with self._lock:
+            if node in self._connections:
+                return self._connections[node]
+
+        conn = self._connect(node)
+
+        with self._lock:
+            return self._connections.setdefault(node, conn)
+
+
+    def map(self, fn, nodes, name=None, trial=None, raise_on_failure=True):
+        """Call ``fn(node, connection)`` for every node.
+
+        :param fn: the operation
+        :param nodes: the nodes
+        :param name: the timer name to record each node's time under (None to not record)
+        :param trial: the trial to associate recorded times with
+        :param raise_on_failure: raise if any node failed
+        :returns: the outcome for each node
+        :rtype: :class:`FanOutResult`
+        :raises: :class:`FanOutError` if ``raise_on_failure`` and a node failed
+        """
+
+        result = FanOutResult(nodes)
+        queue = Queue()
+        for node in result.nodes:
+            queue.put(node)
+
+        def work():
+            while True:
+                try:
+                    node = queue.get_nowait()
+                except Empty:
+                    return
+
+                start = time.time()
+                try:
+                    value = fn(node, self.connection(node))
+                except Exception as e:
+                    logger.debug('Failed on %s: %s', node, e)
+                    result.errors[node] = e
+                else:
+                    result.results[node] = value
+                finally:
+                    result.spans[node] = TimeSpan(start, time.time(), trial=trial)
+
+        count = min(self._concurrency, len(result.nodes))
+        threads = [threading.Thread(target=work) for _ in xrange(count)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self._timer is not None and name is not None:
+            for node in result.nodes:
+                span = result.spans[node]
+                self._timer.record(name, span.start, span.stop, trial=trial)
+
+        if result.errors:
+            logger.warning('%s failed on %d of %d nodes', name or 'fan out',
+                           len(result.errors), len(result.nodes))
+            if raise_on_failure:
+                raise FanOutError(result)
+
+        return result
+
+
+    def close(self):
+        """Close all pooled connections
+        """
+
+        with self._lock:
+            connections = self._connections.values()
+            self._connections = dict()
+
+        for conn in connections:
+            close = getattr(conn, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning('Closing connection failed with %s', e)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
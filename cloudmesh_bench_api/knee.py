@@ -0,0 +1,132 @@
+
+"""
+Find the node count beyond which adding nodes stops paying off.
+
+The knee is the largest node count whose parallel efficiency (the
+throughput per node relative to that of the smallest node count) is at
+least a threshold.  Assuming the efficiency does not increase with the
+node count, the knee is found by bisection, which takes about
+``log2((high - low) / tolerance)`` runs instead of one per node count.
+
+.. python:
+
+   knee = search(lambda **kws: MyBenchmarkRunner(provider_name=providers.comet, **kws),
+                 low=1, high=256, threshold=0.7, tolerance=4,
+                 data_params=lambda n: n * 2**30)
+   print knee.node_count
+   print format_pretty(scaling(knee.reports, 'run'))
+"""
+
+from __future__ import absolute_import
+
+from collections import namedtuple, OrderedDict
+import math
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Knee(namedtuple('Knee', ['node_count', 'lower', 'upper',
+                               'evaluations', 'reports'])):
+    """The outcome of a search for the knee
+
+    - ``node_count``: the largest node count found to be efficient
+    - ``lower``, ``upper``: the knee is in ``[lower, upper)``
+    - ``evaluations``: throughput of each node count run, in the order run
+    - ``reports``: the :class:`Report` of each run, if available
+    """
+    __slots__ = ()
+
+
+def find_knee(evaluate, low, high, threshold=0.5, tolerance=1):
+    """Bisect the node counts for the knee.
+
+    Node counts are split at their geometric mean, since scaling
+    behaviour tends to change by factors of node count.
+
+    :param evaluate: returns the throughput of a node count
+    :param low: the smallest node count, assumed to be efficient
+    :param high: the largest node count
+    :param threshold: the lowest acceptable parallel efficiency
+    :param tolerance: stop when the knee is within this many nodes
+    :rtype: :class:`Knee`
+    :raises: :class:`ValueError` if the throughput at ``low`` is 0
+    """
+
+    if not 1 <= low <= high:
+        raise ValueError('Invalid node count range [{}, {}]'.format(low, high))
+    if tolerance < 1:
+        raise ValueError('Tolerance less than 1: {}'.format(tolerance))
+
+    evaluations = OrderedDict()
+
+    def efficiency(n):
+        if n not in evaluations:
+            evaluations[n] = evaluate(n)
+            logger.info('%d nodes: throughput %s', n, evaluations[n])
+        base = float(evaluations[low]) / low
+        if base <= 0:
+            raise ValueError('No throughput at the lowest node count {}'
+                             .format(low))
+        return float(evaluations[n]) / n / base
+
+    efficiency(low)
+
+    if efficiency(high) >= threshold:
+        return Knee(high, high, high, evaluations, [])
+
+    lower, upper = low, high
+    while upper - lower > tolerance:
+        mid = int(round(math.sqrt(lower * upper)))
+        mid = min(max(mid, lower + 1), upper - 1)
+
+        if efficiency(mid) >= threshold:
+            lower = mid
+        else:
+            upper = mid
+
+    return Knee(lower, lower, upper, evaluations, [])
+
+
+def search(factory, low, high, name='run', times=1, data_params=None,
+           threshold=0.5, tolerance=1):
+    """Run benchmarks at the node counts needed to find the knee.
+
+    A node count at which the phase was never measured, for instance
+    because launching the cluster failed, has a throughput of 0.
+
+    :param factory: creates a runner, called with ``node_count`` (and ``data_params``) keywords
+    :param low: the smallest node count
+    :param high: the largest node count
+    :param name: the phase whose throughput to use
+    :param times: the number of trials of each node count
+    :param data_params: if given, called with the node count to get the ``data_params`` (e.g. for weak scaling)
+    :param threshold: the lowest acceptable parallel efficiency
+    :param tolerance: stop when the knee is within this many nodes
+    :rtype: :class:`Knee`
+    """
+
+    reports = OrderedDict()
+
+    def evaluate(node_count):
+        kws = dict(node_count=node_count)
+        if data_params is not None:
+            kws['data_params'] = data_params(node_count)
+
+        runner = factory(**kws)
+        runner.bench(times=times)
+
+        report = runner.report
+        reports[node_count] = report
+
+        rate = report.rate(name)
+        if rate is None:
+            logger.warning('%d nodes: %s was not measured, taking its '
+                           'throughput as 0', node_count, name)
+            return 0
+        return rate
+
+    knee = find_knee(evaluate, low, high, threshold=threshold,
+                     tolerance=tolerance)
+
+    return knee._replace(reports=reports.values())
@@ -0,0 +1,227 @@
+
+"""
+A simulated virtual cluster for the :data:`providers.local` provider.
+
+Each node is a long-lived shell process with its own directory, so
+that the configure/launch/deploy logic of a runner can be exercised
+with hundreds or thousands of nodes on one machine.
+
+.. python:
+
+   def _launch(self):
+     if self.provider_name == providers.local:
+       self._cluster = LocalCluster(self.node_count, self.path,
+                                    launch_latency=2, failure_rate=0.01)
+       failed = self._cluster.launch()
+
+   def _deploy(self):
+     for node in self._cluster.nodes:
+       self._cluster.run(node, 'tar xf ../app.tar.gz')
+
+Each node has two pipes open in the controller, so large clusters may
+need a higher limit on open files (``ulimit -n``).
+"""
+
+from __future__ import absolute_import
+
+from .shell import Shell, ShellError
+
+import os
+import random
+import shutil
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class LocalCluster(object):
+    """
+    A virtual cluster of local worker processes.
+
+    Every node runs in ``<prefix>/<name>`` with the environment
+    variables ``NODE_ID``, ``NODE_NAME``, ``NODE_COUNT`` and ``NODE_DIR``.
+    """
+
+    def __init__(self, node_count, prefix, launch_latency=0.0, jitter=0.0,
+                 failure_rate=0.0, command_failure_rate=0.0, seed=None,
+                 executable='sh'):
+        """
+        :param node_count: number of nodes to simulate
+        :param prefix: directory (created if missing) for the node directories
+        :param launch_latency: seconds it takes for a node to boot
+        :param jitter: extra seconds, chosen uniformly, for each node to boot
+        :param failure_rate: probability of a node failing to launch
+        :param command_failure_rate: probability of a node dying when running a command
+        :param seed: seed for the random choice of latencies and failures
+        :param executable: the shell each node runs
+        """
+
+        if node_count < 1:
+            raise ValueError('Node count less than 1: {}'.format(node_count))
+
+        self._node_count = node_count
+        self._prefix = prefix
+        self._launch_latency = launch_latency
+        self._jitter = jitter
+        self._failure_rate = failure_rate
+        self._command_failure_rate = command_failure_rate
+        self._random = random.Random(seed)
+        self._executable = executable
+
+        self._names = ['node-%d' % i for i in xrange(node_count)]
+        self._shells = dict()
+        self._failed = list()
+
+
+    @property
+    def node_count(self):
+        return self._node_count
+
+
+    @property
+    def nodes(self):
+        """The names of the nodes that are running
+
+        :rtype: :class:`list` of :class:`str`
+        """
+
+        return [n for n in self._names if n in self._shells]
+
+
+    @property
+    def failed(self):
+        """The names of the nodes that failed
+
+        :rtype: :class:`list` of :class:`str`
+        """
+
+        return list(self._failed)
+
+
+    def path(self, name):
+        """
+        :returns: the directory of a node
+        :rtype: :class:`str`
+        """
+
+        return os.path.join(self._prefix, name)
+
+
+    def launch(self):
+        """Start all the nodes.
+
+        The nodes boot concurrently, so this takes about
+        ``launch_latency + jitter`` seconds regardless of the number
+        of nodes.
+
+        :returns: the names of the nodes that failed to launch
+        :rtype: :class:`list` of :class:`str`
+        """
+
+        booting = list()
+        failed = list()
+
+        try:
+            for i, name in enumerate(self._names):
+                path = self.path(name)
+                if not os.path.exists(path):
+                    os.makedirs(path)
+
+                env = dict(os.environ)
+                env.update(NODE_ID    = str(i),
+                           NODE_NAME  = name,
+                           NODE_COUNT = str(self._node_count),
+                           NODE_DIR   = path)
+
+                shell = Shell(env=env, cwd=path, executable=self._executable)
+                booting.append((name, shell))
+                latency = self._launch_latency + self._random.uniform(0, self._jitter)
+                shell.submit('sleep %f' % latency)
+
+            for name, shell in booting:
+                shell.receive(name=None)
+
+                if self._random.random() < self._failure_rate:
+                    shell.close()
+                    failed.append(name)
+                else:
+                    self._shells[name] = shell
+
+        except Exception:
+            # e.g. too many open files: do not leave the booted shells behind
+            for name, shell in booting:
+                if self._shells.get(name) is not shell:
+                    shell.close()
+            raise
+
+        if failed:
+            logger.warning('%d of %d nodes failed to launch',
+                           len(failed), self._node_count)
+
+        self._failed.extend(failed)
+        return failed
+
+
+    def shell(self, name):
+        """The shell of a running node
+
+        :rtype: :class:`Shell`
+        :raises: :class:`ShellError` if the node is not running
+        """
+
+        try:
+            return self._shells[name]
+        except KeyError:
+            raise ShellError('Node {} is not running'.format(name))
+
+
+    def run(self, name, command, check=True):
+        """Run a command on a node
+
+        :param name: the node
+        :param command: the command to run
+        :param check: raise if the command fails
+        :rtype: :class:`cloudmesh_bench_api.shell.Result`
+        :raises: :class:`ShellError` if the command fails or the node dies
+        """
+
+        shell = self.shell(name)
+
+        if self._random.random() < self._command_failure_rate:
+            self.fail(name)
+            raise ShellError('Node {} died running {!r}'.format(name, command))
+
+        if check:
+            return shell.check(command, name=None)
+        else:
+            return shell(command, name=None)
+
+
+    def fail(self, name):
+        """Stop a node as if it crashed
+        """
+
+        shell = self._shells.pop(name)
+        shell.close()
+        self._failed.append(name)
+
+
+    def terminate(self):
+        """Stop all the nodes and remove their directories
+        """
+
+        for name in self.nodes:
+            self._shells.pop(name).close()
+
+        for name in self._names:
+            path = self.path(name)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.terminate()
@@ -0,0 +1,187 @@
+
+"""
+Expose the progress of a benchmark over HTTP while it runs.
+
+.. python:
+
+   with MetricsServer(runner, port=9100):
+     runner.bench(times=20)
+
+and, from another terminal::
+
+   $ curl localhost:9100/metrics
+
+The metrics are in the plain-text exposition format of Prometheus.
+They are computed from the runner's timer when scraped, so the
+measurements themselves are not slowed down.
+"""
+
+from __future__ import absolute_import
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+#: Upper bounds (in seconds) of the phase duration histogram buckets
+BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600]
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')\
+                     .replace('\n', '\\n')
+
+
+def exposition(runner, buckets=BUCKETS):
+    """Render the metrics of a runner
+
+    :param runner: the runner
+    :type runner: :class:`AbstractBenchmarkRunner`
+    :param buckets: upper bounds of the histogram buckets
+    :rtype: :class:`str`
+    """
+
+    timer = runner._timer
+    now = time.time()
+    lines = list()
+
+    def metric(name, kind, doc):
+        lines.append('# HELP {} {}'.format(name, doc))
+        lines.append('# TYPE {} {}'.format(name, kind))
+
+    metric('bench_phase_seconds', 'histogram',
+           'Duration of the completed phases')
+    for name in timer.names:
+        seconds = sorted(span.seconds for span in list(timer.times(name)))
+        phase = 'phase="{}"'.format(_label(name))
+
+        count = 0
+        for bound in buckets:
+            while count < len(seconds) and seconds[count] <= bound:
+                count += 1
+            lines.append('bench_phase_seconds_bucket{{{},le="{}"}} {}'
+                         .format(phase, bound, count))
+        lines.append('bench_phase_seconds_bucket{{{},le="+Inf"}} {}'
+                     .format(phase, len(seconds)))
+        lines.append('bench_phase_seconds_sum{{{}}} {}'
+                     .format(phase, repr(float(sum(seconds)))))
+        lines.append('bench_phase_seconds_count{{{}}} {}'
+                     .format(phase, len(seconds)))
+
+    metric('bench_phase_running_seconds', 'gauge',
+           'Time spent so far in the running phases')
+    for name, trial, start in timer.active:
+        lines.append('bench_phase_running_seconds{{phase="{}",trial="{}"}} {}'
+                     .format(_label(name), trial, repr(now - start)))
+
+    progress = runner.progress
+    values = [('bench_trials_total', 'Number of trials to run',
+               progress['total']),
+              ('bench_trials_completed', 'Number of trials finished',
+               progress['completed']),
+              ('bench_elapsed_seconds', 'Time since the benchmark started',
+               progress['elapsed']),
+              ('bench_eta_seconds', 'Estimated time until the benchmark finishes',
+               progress['eta'])]
+
+    for name, doc, value in values:
+        if value is None:
+            continue
+        metric(name, 'gauge', doc)
+        lines.append('{} {}'.format(name, repr(float(value))))
+
+    return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = exposition(self.server.runner)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MetricsServer(object):
+    """
+    An HTTP server, in a background thread, exposing the metrics of a
+    runner at ``/metrics``.
+    """
+
+    def __init__(self, runner, host='127.0.0.1', port=0):
+        """
+        :param runner: the runner to expose
+        :type runner: :class:`AbstractBenchmarkRunner`
+        :param host: the address to listen on
+        :param port: the port to listen on (0 picks a free port)
+        """
+
+        self._runner = runner
+        self._address = (host, port)
+        self._server = None
+        self._thread = None
+
+
+    @property
+    def url(self):
+        """
+        :returns: the URL of the metrics, once started
+        :rtype: :class:`str`
+        """
+
+        host, port = self._server.server_address
+        return 'http://{}:{}/metrics'.format(host, port)
+
+
+    def start(self):
+        """Start serving in the background
+        """
+
+        self._server = _Server(self._address, _Handler)
+        self._server.runner = self._runner
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='metrics')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info('Serving metrics at %s', self.url)
+
+
+    def stop(self):
+        """Stop serving
+        """
+
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,247 @@
+
+"""
+Reduce and record the noise of phases that run on the controller.
+
+.. python:
+
+   isolation = Isolation(cpus=[2, 3], priority=5)
+   print isolation.fingerprint()
+
+   with isolation():
+     prepare()
+
+Pinning uses :func:`os.sched_setaffinity` where available, otherwise
+``sched_setaffinity`` of the C library (on Linux).  Raising the priority usually needs
+elevated privileges; when it is not permitted this is logged and the
+phase runs at the normal priority.
+"""
+
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import ctypes
+import ctypes.util
+import glob
+import os
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _cpu_times():
+    """Total and idle jiffies of all CPUs, from ``/proc/stat``
+    """
+
+    with open('/proc/stat') as fd:
+        fields = fd.readline().split()[1:]
+
+    values = map(int, fields)
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    return sum(values), idle
+
+
+def _read(path):
+    try:
+        with open(path) as fd:
+            return fd.read().strip()
+    except IOError:
+        return None
+
+
+def cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def background(interval=0.1):
+    """The fraction of CPU time used by other processes.
+
+    :param interval: seconds to sample for
+    :returns: a fraction between 0 and 1, or None if unknown
+    :rtype: :class:`float`
+    """
+
+    try:
+        total0, idle0 = _cpu_times()
+    except IOError:
+        return None
+
+    own0 = sum(os.times()[:4])
+    time.sleep(interval)
+    own1 = sum(os.times()[:4])
+    total1, idle1 = _cpu_times()
+
+    total = total1 - total0
+    if total <= 0:
+        return 0.0
+
+    busy = 1.0 - float(idle1 - idle0) / total
+    own = (own1 - own0) / (interval * cpu_count())
+    return max(0.0, busy - own)
+
+
+def fingerprint(interval=0.1):
+    """Describe how busy the machine is.
+
+    The fingerprint contains:
+
+    - ``cpus``: the number of CPUs
+    - ``loadavg``: the 1, 5, and 15 minute load averages
+    - ``governors``: the CPU frequency governors in use
+    - ``mhz``: the mean current CPU frequency
+    - ``background``: see :func:`background`
+
+    Values that cannot be determined are None.
+
+    :param interval: seconds to sample the background CPU use for
+    :rtype: :class:`dict`
+    """
+
+    try:
+        loadavg = list(os.getloadavg())
+    except OSError:
+        loadavg = None
+
+    cpufreq = '/sys/devices/system/cpu/cpu[0-9]*/cpufreq/'
+    governors = [_read(p) for p in glob.glob(cpufreq + 'scaling_governor')]
+    governors = sorted(set(g for g in governors if g)) or None
+
+    khz = [_read(p) for p in glob.glob(cpufreq + 'scaling_cur_freq')]
+    khz = [int(f) for f in khz if f]
+    mhz = sum(khz) / 1000.0 / len(khz) if khz else None
+
+    return dict(cpus       = cpu_count(),
+                loadavg    = loadavg,
+                governors  = governors,
+                mhz        = mhz,
+                background = background(interval))
+
+
+#: The number of CPUs in a ``cpu_set_t`` (``CPU_SETSIZE`` in glibc)
+CPU_SETSIZE = 1024
+
+_BITS = 8 * ctypes.sizeof(ctypes.c_ulong)
+_cpu_set_t = ctypes.c_ulong * (CPU_SETSIZE // _BITS)
+_libc = None
+
+
+def _sched(name, mask):
+    """Call ``sched_getaffinity`` or ``sched_setaffinity`` of the C
+    library for the current thread.
+
+    :returns: False if the function is not available
+    :raises: :class:`OSError` if the call fails
+    """
+
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                use_errno=True)
+        except OSError:
+            _libc = False
+
+    if not _libc or not hasattr(_libc, name):
+        return False
+
+    if getattr(_libc, name)(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return True
+
+
+def get_affinity():
+    """The CPUs the current process (or thread) may run on
+
+    :returns: the CPUs, or None if unknown
+    :rtype: :class:`set` of :class:`int`
+    """
+
+    if hasattr(os, 'sched_getaffinity'):
+        return os.sched_getaffinity(0)
+
+    mask = _cpu_set_t()
+    if not _sched('sched_getaffinity', mask):
+        return None
+
+    return set(i for i in xrange(CPU_SETSIZE)
+               if mask[i // _BITS] >> (i % _BITS) & 1)
+
+
+def set_affinity(cpus):
+    """Pin the current process (or thread, where supported) to CPUs
+
+    :returns: True if pinned
+    :rtype: :class:`bool`
+    """
+
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        return True
+
+    mask = _cpu_set_t()
+    for cpu in cpus:
+        mask[cpu // _BITS] |= 1 << (cpu % _BITS)
+
+    if not _sched('sched_setaffinity', mask):
+        logger.warning('Cannot pin to CPUs %s: not supported', sorted(cpus))
+        return False
+    return True
+
+
+class Isolation(object):
+    """
+    Settings to isolate local phases from the rest of the machine.
+    """
+
+    def __init__(self, cpus=None, priority=None, interval=0.1):
+        """
+        :param cpus: the CPUs to pin to (default: do not pin)
+        :type cpus: iterable of :class:`int`
+        :param priority: how much to decrease the niceness by (default: do not change)
+        :type priority: :class:`int`
+        :param interval: seconds to sample the background CPU use for in :func:`fingerprint`
+        """
+
+        self.cpus = set(cpus) if cpus is not None else None
+        self.priority = priority
+        self.interval = interval
+
+
+    def fingerprint(self):
+        """See :func:`fingerprint`
+        """
+
+        return fingerprint(interval=self.interval)
+
+
+    @contextmanager
+    def __call__(self):
+        """Run under isolation, restoring the affinity and priority after.
+        """
+
+        affinity = None
+        if self.cpus:
+            previous = get_affinity()
+            if set_affinity(self.cpus):
+                affinity = previous
+
+        raised = False
+        if self.priority:
+            try:
+                os.nice(-self.priority)
+                raised = True
+            except OSError as e:
+                logger.info('Cannot raise priority by %d: %s', self.priority, e)
+
+        try:
+            yield
+        finally:
+            if raised:
+                os.nice(self.priority)
+            if affinity is not None:
+                set_affinity(affinity)
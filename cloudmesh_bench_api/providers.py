@@ -7,9 +7,13 @@ Intended usage is something like:
 >>> from cloudmesh_bench_api import providers:
 >>> if self.provider_name == providers.openstack:
 >>> ... cleanOpenstack()
+
+The ``local`` provider simulates a virtual cluster with processes on
+the local machine, see :class:`cloudmesh_bench_api.local.LocalCluster`.
 """
 
 
 openstack = 'openstack'
 comet = 'comet'
 amazon_ec2 = 'amazon ec2'
+local = 'local'
@@ -3,83 +3,582 @@ from __future__ import absolute_import
 
 from .timer import Timer
 
-from pxul.StringIO import StringIO
-import numpy as np
-
+from collections import OrderedDict
 from operator import attrgetter
 
 
+def format_csv(entries, header=True, commentChar='#'):
+    """Format a table as CSV
+
+    .. python:
+
+       print format_csv(scaling(reports, 'run'))
+
+    :param entries: iterable of rows, the first being the header if ``header``
+    :param header: whether or not the first row is a header
+    :param commentChar: prefix of the header line
+    :rtype: :class:`str`
+    """
+
+    from pxul.StringIO import StringIO
+
+    s = StringIO()
+
+    entries = iter(entries)
+
+    if header:
+        s.write(commentChar)
+        s.writeln(','.join(entries.next()))
+
+    for row in entries:
+        s.writeln(','.join(map(str, row)))
+
+    return s.getvalue()
+
+
+def format_pretty(entries, precision=2):
+    """Format a table with aligned columns
+
+    :param entries: iterable of rows
+    :param precision: number of digits after the decimal point of floats
+    :rtype: :class:`str`
+    """
+
+    from pxul.StringIO import StringIO
+
+    def fmt(width, val, precision):
+
+        if isinstance(val, int):
+            s = 'd'
+        elif isinstance(val, float):
+            s = '.{}f'.format(precision)
+        else:
+            s = 's'
+
+        f = '%{:d}{}'.format(width, s)
+
+        return f % val
+
+    entries = list(entries)
+    widths = [0] * len(entries[0])
+    for row in entries:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(fmt(1, value, precision)))
+    widths = [w + 1 for w in widths]
+
+    s = StringIO()
+
+    for row in entries:
+        for i, val in enumerate(row):
+            s.write(fmt(widths[i], val, precision))
+        s.write('\n')
+
+
+    return s.getvalue()
+
+
+def scaling(reports, name, header=True):
+    """Compare the time of a phase across runs with different node counts.
+
+    The speedup is the ratio of the throughput to that of the run with
+    the fewest nodes that measured the phase (or of the time, if the
+    phase has no work), and the parallel efficiency is the speedup
+    divided by the ratio of node counts.  If the work grows with the
+    number of nodes (weak scaling) the efficiency is thus the ratio of
+    times, and if the work is fixed (strong scaling) it is the ratio
+    of node-seconds.
+
+    :param reports: the reports of each run
+    :type reports: iterable of :class:`Report`
+    :param name: the phase to compare
+    :param header: whether or not to include a header
+    :returns: generator of lists, ordered by node count (``nan`` where the phase was not measured, or the throughput of one that took no time)
+    """
+
+    if header:
+        yield ['nodes', 'mean', 'node_seconds', 'work', 'throughput',
+               'speedup', 'efficiency']
+
+    reports = sorted(reports, key=attrgetter('node_count'))
+    if not reports:
+        return
+
+    nan = float('nan')
+    measured = [r for r in reports if r.rate(name) is not None]
+    base = measured[0] if measured else None
+
+    for report in reports:
+        times = report._seconds(name)
+        mean = sum(times) / len(times) if times else nan
+        work, _ = report.work(name)
+
+        rate = report.rate(name)
+        if rate is None:
+            speedup = efficiency = nan
+        else:
+            speedup = rate / base.rate(name)
+            efficiency = speedup * base.node_count / report.node_count
+
+        yield [report.node_count, mean, mean * report.node_count,
+               nan if work is None else work,
+               nan if work is None or rate is None else rate,
+               speedup, efficiency]
+
+
+#: The relative size below which differences are taken to be rounding
+#: error by :func:`change_points`
+CHANGE_POINT_RTOL = 1e-6
+
+
+def change_points(values, min_size=2, penalty=None):
+    """Find where the mean of a series shifts, by binary segmentation.
+
+    A segment is split where doing so most reduces the sum of squared
+    deviations from the segment means, as long as the reduction
+    exceeds the penalty.  The reduction for every split point of a
+    segment is computed at once from cumulative sums.
+
+    Splits that reduce the deviations by less than
+    :data:`CHANGE_POINT_RTOL` of their total are rounding error, not a
+    shift, and are never made.
+
+    :param values: the series
+    :type values: sequence of :class:`float`
+    :param min_size: the smallest number of values in a segment
+    :param penalty: the smallest reduction to split at (default: ``2 * sigma^2 * log(n)``, with sigma estimated from the differences of consecutive values, or their standard deviation if most differences are 0, and at least :data:`CHANGE_POINT_RTOL` of the mean)
+    :returns: the indices at which new segments start, in order
+    :rtype: :class:`list` of :class:`int`
+    """
+
+    import numpy as np
+
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    if n < 2 * min_size:
+        return []
+
+    if penalty is None:
+        sigma = np.median(np.abs(np.diff(x))) / (0.6745 * np.sqrt(2))
+        if sigma == 0:
+            # quantized values, e.g. timings with a coarse clock
+            sigma = np.std(x)
+        sigma = max(sigma, CHANGE_POINT_RTOL * abs(np.mean(x)))
+        penalty = 2 * sigma ** 2 * np.log(n)
+
+    def best_split(lo, hi):
+        seg = x[lo:hi]
+        m = len(seg)
+        if m < 2 * min_size:
+            return None, 0.0, 0.0
+
+        cs = np.cumsum(seg)
+        cs2 = np.cumsum(seg * seg)
+        k = np.arange(min_size, m - min_size + 1)
+
+        left, left2 = cs[k - 1], cs2[k - 1]
+        right, right2 = cs[-1] - left, cs2[-1] - left2
+        sse = (left2 - left ** 2 / k) + (right2 - right ** 2 / (m - k))
+        total = cs2[-1] - cs[-1] ** 2 / m
+
+        i = np.argmax(total - sse)
+        return lo + int(k[i]), float(total - sse[i]), float(total)
+
+    points = list()
+    segments = [(0, n)]
+    while segments:
+        lo, hi = segments.pop()
+        split, gain, total = best_split(lo, hi)
+        if split is not None and gain > penalty \
+           and gain > CHANGE_POINT_RTOL * total:
+            points.append(split)
+            segments.extend([(lo, split), (split, hi)])
+
+    return sorted(points)
+
+
+
 class Report(object):
 
-    def __init__(self, timer):
+    def __init__(self, timer, node_count=1):
+        """
+        :param timer: the measured times
+        :type timer: :class:`Timer`
+        :param node_count: the number of nodes the times were measured with
+        """
+
         assert isinstance(timer, Timer)
 
         self._timer = timer
+        self._node_count = node_count
+        self._work = OrderedDict()
+        self._fingerprints = dict()
+
+
+    @property
+    def node_count(self):
+        return self._node_count
+
+
+    def set_work(self, name, amount, unit='bytes'):
+        """Set the amount of work done each time a phase is run, such as
+        the number of bytes processed.
+
+        :param name: the phase
+        :param amount: the amount of work
+        :type amount: :class:`int` or :class:`float`
+        :param unit: the unit of work
+        """
+
+        self._work[name] = (amount, unit)
+
+
+    def work(self, name):
+        """The work done each time a phase is run
+
+        :returns: amount and unit, or (None, None) if not set
+        :rtype: :class:`tuple`
+        """
+
+        return self._work.get(name, (None, None))
+
+
+    def set_fingerprint(self, trial, fingerprint):
+        """Set the machine fingerprint a trial was taken under
+
+        :param trial: the trial
+        :param fingerprint: see :func:`cloudmesh_bench_api.noise.fingerprint`
+        :type fingerprint: :class:`dict`
+        """
+
+        self._fingerprints[trial] = fingerprint
+
+
+    def noisy(self, max_load=1.0, max_background=0.1, governors=None):
+        """The trials that were taken while the machine was busy.
+
+        A trial is noisy if the 1-minute load average per CPU exceeded
+        ``max_load``, if other processes used more than
+        ``max_background`` of the CPU time, or if a CPU frequency
+        governor was not one of ``governors``.  Unknown values are not
+        considered noisy.
+
+        .. python:
+
+           print report.pretty(exclude=report.noisy())
+
+        :param max_load: highest acceptable load average per CPU (None to ignore)
+        :param max_background: highest acceptable background CPU use (None to ignore)
+        :param governors: acceptable governors, such as ``['performance']`` (None to ignore)
+        :rtype: :class:`set` of trial indices
+        """
+
+        noisy = set()
+
+        for trial, fp in self._fingerprints.iteritems():
+            load = fp.get('loadavg')
+            if max_load is not None and load and \
+               load[0] / fp.get('cpus', 1) > max_load:
+                noisy.add(trial)
+
+            bg = fp.get('background')
+            if max_background is not None and bg is not None and \
+               bg > max_background:
+                noisy.add(trial)
+
+            used = fp.get('governors')
+            if governors is not None and used and \
+               not set(used).issubset(governors):
+                noisy.add(trial)
+
+        return noisy
+
+
+    def noise(self, header=True, **kwargs):
+        """Iterate over the machine fingerprints of each trial
+
+        :param header: whether or not to include a header
+        :param kwargs: passed to :func:`noisy`
+        :returns: generator of lists
+        """
+
+        if header:
+            yield ['trial', 'load', 'background', 'governors', 'mhz', 'noisy']
+
+        noisy = self.noisy(**kwargs)
+        nan = float('nan')
+
+        for trial in sorted(self._fingerprints):
+            fp = self._fingerprints[trial]
+            load = fp.get('loadavg')
+            bg = fp.get('background')
+            mhz = fp.get('mhz')
+
+            yield [trial,
+                   float(load[0]) if load else nan,
+                   float(bg) if bg is not None else nan,
+                   '/'.join(fp.get('governors') or ['-']),
+                   float(mhz) if mhz is not None else nan,
+                   int(trial in noisy)]
+
+
+    def _seconds(self, name, exclude=None):
+        """The measured seconds of a phase, without the excluded trials
+        """
 
+        spans = self._spans(name)
+        if exclude:
+            spans = (s for s in spans if s.trial not in exclude)
+        return map(attrgetter('seconds'), spans)
 
-    def rows(self, header=True):
+
+    def _spans(self, name):
+        """The spans of a phase, or none if it was not measured.
+
+        Unlike :func:`Timer.times` this does not add the phase to the
+        timer.
+        """
+
+        if name not in list(self._timer.names):
+            return []
+        return list(self._timer.times(name))
+
+
+    def rows(self, header=True, exclude=None):
         """Iterate over the entries in tabular form
 
         :param header: whether or not to include a header
+        :param exclude: trials to leave out, such as :func:`noisy`
         :returns: generator of lists
         """
-        
+
         if header:
             yield ['name', 'count', 'min', 'max', 'mean']
 
         for name in self._timer.names:
-            times   = map(attrgetter('seconds'), self._timer.times(name))
+            times   = self._seconds(name, exclude=exclude)
+            if not times:
+                continue
+
             count   = len(times)
             min_    = min(times)
             max_    = max(times)
-            mean    = self._timer.average(name)
+            mean    = sum(times) / count
 
             yield [name, count, min_, max_, mean]
 
 
-    def csv(self, header=True, commentChar='#'):
-        s = StringIO()
+    def throughput(self, header=True, exclude=None):
+        """Iterate over the cost and throughput of each phase.
 
-        entries = self.rows(header=header)
+        The node-seconds are the mean time multiplied by the number of
+        nodes.  The work and throughput (work per second, overall and
+        per node) are ``nan`` for phases without work, and the
+        throughput is also ``nan`` for phases that took no time.
 
-        if header:
-            s.write(commentChar)
-            s.writeln(','.join(entries.next()))
+        :param header: whether or not to include a header
+        :param exclude: trials to leave out, such as :func:`noisy`
+        :returns: generator of lists
+        """
 
-        for row in entries:
-            s.writeln(','.join(map(str, row)))
+        if header:
+            yield ['name', 'nodes', 'mean', 'node_seconds', 'work', 'unit',
+                   'throughput', 'throughput_per_node']
 
-        return s.getvalue()
+        nan = float('nan')
 
+        for name in self._timer.names:
+            times = self._seconds(name, exclude=exclude)
+            if not times:
+                continue
 
-    def pretty(self, header=True, precision=2):
+            mean = sum(times) / len(times)
+            work, unit = self.work(name)
 
-        def fmt(width, val, precision):
-            
-            if isinstance(val, int):
-                s = 'd'
-            elif isinstance(val, float):
-                s = '.{}f'.format(precision)
+            if work is None:
+                work, unit, rate = nan, '-', nan
             else:
-                s = 's'
+                rate = self.rate(name, exclude=exclude)
+                if rate is None:
+                    rate = nan
+
+            yield [name, self._node_count, mean, mean * self._node_count,
+                   work, unit, rate, rate / self._node_count]
+
+
+    def rate(self, name, exclude=None):
+        """The work done per second by a phase, on average.
+
+        Without work set for the phase, each run counts as one unit,
+        so this is the number of runs per second.
+
+        :param name: the phase
+        :param exclude: trials to leave out, such as :func:`noisy`
+        :returns: the rate, or None if the phase was not measured
+        :rtype: :class:`float`
+        """
+
+        times = self._seconds(name, exclude=exclude)
+        mean = sum(times) / len(times) if times else 0
+        if mean <= 0:
+            return None
+
+        work, _ = self.work(name)
+        if work is None:
+            work = 1
+        return work / mean
 
-            f = '%{:d}{}'.format(width, s)
 
-            return f % val
+    def _array(self, name, exclude=None):
+        """The trials and seconds of a phase as arrays ordered by trial.
+
+        Spans without a trial are numbered by their position.
+        """
+
+        import numpy as np
+
+        spans = self._spans(name)
+        if exclude:
+            spans = [sp for sp in spans if sp.trial not in exclude]
+
+        count = len(spans)
+        trials = np.fromiter((i if sp.trial is None else sp.trial
+                              for i, sp in enumerate(spans)),
+                             dtype=int, count=count)
+        starts = np.fromiter((sp.start for sp in spans), dtype=float, count=count)
+        stops = np.fromiter((sp.stop for sp in spans), dtype=float, count=count)
+
+        order = np.lexsort((starts, trials))
+        return trials[order], (stops - starts)[order]
+
+
+    def histogram(self, name, bins=10, range=None, header=True, exclude=None):
+        """Iterate over a histogram of the times of a phase
+
+        :param name: the phase
+        :param bins: the number of bins, their edges, or a method such as ``'auto'`` (see :func:`numpy.histogram`)
+        :param range: the (lower, upper) seconds to bin (default: the min and max)
+        :param header: whether or not to include a header
+        :param exclude: trials to leave out, such as :func:`noisy`
+        :returns: generator of lists
+        """
+
+        import numpy as np
+
+        if header:
+            yield ['lower', 'upper', 'count']
+
+        _, seconds = self._array(name, exclude=exclude)
+        if not len(seconds):
+            return
+
+        counts, edges = np.histogram(seconds, bins=bins, range=range)
+        for i, count in enumerate(counts):
+            yield [float(edges[i]), float(edges[i + 1]), int(count)]
+
+
+    def _series(self, name, exclude=None):
+        import numpy as np
+
+        trials, seconds = self._array(name, exclude=exclude)
+        unique, index = np.unique(trials, return_inverse=True)
+        counts = np.bincount(index)
+        totals = np.bincount(index, weights=seconds)
+        return unique, counts, totals
+
+
+    def series(self, name, header=True, exclude=None):
+        """Iterate over the time of a phase in each trial, in trial order
+
+        :param name: the phase
+        :param header: whether or not to include a header
+        :param exclude: trials to leave out, such as :func:`noisy`
+        :returns: generator of lists
+        """
+
+        if header:
+            yield ['trial', 'count', 'total', 'mean']
+
+        trials, counts, totals = self._series(name, exclude=exclude)
+        for trial, count, total in zip(trials, counts, totals):
+            yield [int(trial), int(count), float(total), float(total / count)]
+
+
+    def trend(self, name, exclude=None):
+        """Fit a line to the mean time of a phase over trial order.
+
+        :param name: the phase
+        :param exclude: trials to leave out, such as :func:`noisy`
+        :returns: ``slope`` (seconds per trial), ``intercept``, ``relative_slope`` (slope over the mean), and ``r2`` (coefficient of determination)
+        :rtype: :class:`dict`
+        """
+
+        import numpy as np
+
+        trials, counts, totals = self._series(name, exclude=exclude)
+        means = totals / counts
+        nan = float('nan')
+
+        if len(trials) < 2:
+            return dict(slope=nan, intercept=nan, relative_slope=nan, r2=nan)
+
+        slope, intercept = np.polyfit(trials, means, 1)
+        residuals = means - (slope * trials + intercept)
+        variance = np.sum((means - means.mean()) ** 2)
+        r2 = 1 - np.sum(residuals ** 2) / variance if variance > 0 else nan
+
+        return dict(slope          = float(slope),
+                    intercept      = float(intercept),
+                    relative_slope = float(slope / means.mean()),
+                    r2             = float(r2))
+
+
+    def change_points(self, name, min_size=2, penalty=None, exclude=None):
+        """The trials at which the mean time of a phase shifts
+
+        :param name: the phase
+        :param min_size: the fewest trials between shifts
+        :param penalty: see :func:`change_points`
+        :param exclude: trials to leave out, such as :func:`noisy`
+        :rtype: :class:`list` of trial indices
+        """
+
+        trials, counts, totals = self._series(name, exclude=exclude)
+        points = change_points(totals / counts, min_size=min_size,
+                               penalty=penalty)
+        return [int(trials[i]) for i in points]
+
+
+    def drift(self, header=True, exclude=None, min_size=2):
+        """Iterate over the trend and change points of each phase
+
+        :param header: whether or not to include a header
+        :param exclude: trials to leave out, such as :func:`noisy`
+        :param min_size: the fewest trials between change points
+        :returns: generator of lists
+        """
+
+        if header:
+            yield ['name', 'trials', 'slope', 'relative_slope', 'r2',
+                   'change_points']
+
+        for name in self._timer.names:
+            trials, _, _ = self._series(name, exclude=exclude)
+            if not len(trials):
+                continue
+
+            trend = self.trend(name, exclude=exclude)
+            points = self.change_points(name, min_size=min_size,
+                                        exclude=exclude)
 
-        entries = list(self.rows(header=header))
-        widths = np.zeros(len(entries[0]), dtype=int)
-        for row in entries:
-            for i, value in enumerate(row):
-                widths[i] = max(widths[i], len(fmt(1, value, precision)))
-        widths += 1
+            yield [name, len(trials), trend['slope'], trend['relative_slope'],
+                   trend['r2'], '/'.join(map(str, points)) or '-']
 
-        s = StringIO()
 
-        for row in entries:
-            for i, val in enumerate(row):
-                s.write(fmt(widths[i], val, precision))
-            s.write('\n')
+    def csv(self, header=True, commentChar='#', exclude=None):
+        return format_csv(self.rows(header=header, exclude=exclude),
+                          header=header, commentChar=commentChar)
 
 
-        return s.getvalue()
+    def pretty(self, header=True, precision=2, exclude=None):
+        return format_pretty(self.rows(header=header, exclude=exclude),
+                             precision=precision)
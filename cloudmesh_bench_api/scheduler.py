@@ -0,0 +1,144 @@
+
+"""
+Run a graph of dependent tasks, each of which needs a resource.
+
+A task runs once all of its dependencies have finished and its
+resource has spare capacity.  Tasks that do not compete for a resource
+run at the same time on separate threads.
+
+.. python:
+
+   scheduler = Scheduler(dict(network=1, cluster=1))
+   scheduler.add('fetch', fetch, 'network')
+   scheduler.add('run', run, 'cluster', deps=['fetch'])
+   scheduler.run()
+"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+from Queue import Queue
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Task(object):
+
+    __slots__ = ['key', 'fn', 'resources', 'deps']
+
+    def __init__(self, key, fn, resources=None, deps=None):
+        self.key = key
+        self.fn = fn
+        self.resources = list(resources or list())
+        self.deps = list(deps or list())
+
+
+class Scheduler(object):
+    """
+    A scheduler of a directed acyclic graph of tasks.
+
+    When several tasks are ready, they are started in the order they
+    were added.
+    """
+
+    def __init__(self, capacities=None):
+        """
+        :param capacities: the number of tasks that may use each resource at once (default: unlimited)
+        :type capacities: :class:`dict` of :class:`str` to :class:`int`
+        """
+
+        self._capacities = dict(capacities or dict())
+        self._tasks = OrderedDict()
+
+
+    def add(self, key, fn, resource=None, deps=None):
+        """Add a task
+
+        :param key: unique name of the task
+        :param fn: the function to call (without arguments)
+        :param resource: the resource, or list of resources, the task uses while running (None: no resource)
+        :param deps: keys of the tasks that must finish first
+        """
+
+        if key in self._tasks:
+            raise ValueError('Duplicate task {!r}'.format(key))
+
+        for dep in deps or list():
+            if dep not in self._tasks:
+                raise ValueError('Task {!r} depends on unknown task {!r}'
+                                 .format(key, dep))
+
+        if resource is None:
+            resources = list()
+        elif isinstance(resource, basestring):
+            resources = [resource]
+        else:
+            resources = list(resource)
+
+        self._tasks[key] = Task(key, fn, resources=resources, deps=deps)
+
+
+    def run(self):
+        """Run all the tasks.
+
+        If a task raises, no further tasks are started and the
+        exception is reraised once the running tasks have finished.
+        """
+
+        pending = OrderedDict(self._tasks)
+        done = set()
+        used = dict((r, 0) for r in self._capacities)
+        running = 0
+        finished = Queue()
+        error = None
+
+        def start(task):
+            def target():
+                try:
+                    task.fn()
+                except Exception as e:
+                    logger.exception('Task %r failed', task.key)
+                    finished.put((task, e))
+                else:
+                    finished.put((task, None))
+
+            thread = threading.Thread(target=target, name=str(task.key))
+            thread.daemon = True
+            thread.start()
+
+        def available(task):
+            if not all(d in done for d in task.deps):
+                return False
+            return all(used[r] < self._capacities[r]
+                       for r in task.resources if r in used)
+
+        def claim(task, count):
+            for r in task.resources:
+                if r in used:
+                    used[r] += count
+
+        while True:
+            if error is None:
+                for key, task in pending.items():
+                    if available(task):
+                        del pending[key]
+                        claim(task, +1)
+                        running += 1
+                        start(task)
+
+            if running == 0:
+                break
+
+            task, e = finished.get()
+            running -= 1
+            done.add(task.key)
+            claim(task, -1)
+            if e is not None and error is None:
+                error = e
+
+        if error is not None:
+            raise error
+
+        assert not pending, 'Unsatisfiable tasks: {}'.format(pending.keys())
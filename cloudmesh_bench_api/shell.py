@@ -0,0 +1,208 @@
+
+"""
+A long-lived shell coprocess to run many commands without paying for
+a new process (and re-sourcing the environment) each time.
+
+.. python:
+
+   with Shell(env=env, files_to_source=['openrc.sh']) as sh:
+     sh.check('nova boot ...')
+     result = sh('nova list')
+     print result.ret, result.out
+"""
+
+from __future__ import absolute_import
+
+from collections import namedtuple
+import subprocess
+import time
+import uuid
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ShellError(Exception):
+    """A command failed or the shell died
+    """
+
+    def __init__(self, msg, result=None):
+        super(ShellError, self).__init__(msg)
+        self.result = result
+
+
+class Result(namedtuple('Result', ['command', 'out', 'ret', 'span'])):
+    """The outcome of a command
+
+    - ``command``: the command that was run
+    - ``out``: the combined stdout and stderr
+    - ``ret``: the exit code
+    - ``span``: the :class:`TimeSpan` the command took
+    """
+    __slots__ = ()
+
+
+class Shell(object):
+    """
+    A shell process that reads commands from its stdin.
+
+    Each command is run in the shell itself (so ``cd``, ``export``,
+    etc. persist), with stdin from ``/dev/null`` and stderr merged into
+    stdout.  The output is framed by a unique marker followed by the
+    exit code of the command.
+    """
+
+    def __init__(self, env=None, files_to_source=None, cwd=None,
+                 executable='bash', timer=None, trial=None):
+        """
+        :param env: the environment of the shell (default: inherit)
+        :type env: :class:`dict` of :class:`str` to :class:`str`
+        :param files_to_source: paths to source when starting the shell
+        :param cwd: the working directory of the shell
+        :param executable: the shell to run
+        :param timer: if given, record the time of each command
+        :type timer: :class:`Timer`
+        :param trial: the trial to associate recorded times with
+        :raises: :class:`ShellError` if sourcing a file fails
+        """
+
+        self._marker = '__cloudmesh_bench_api_%s__' % uuid.uuid4().hex
+        self._timer = timer
+        self._trial = trial
+        self._pending = list()
+
+        if env is not None:
+            env = dict((str(k), str(v)) for k, v in env.iteritems())
+
+        self._proc = subprocess.Popen([executable],
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT,
+                                      env=env,
+                                      cwd=cwd,
+                                      close_fds=True)
+
+        try:
+            for path in files_to_source or list():
+                self.check('. %s' % path, name=None)
+        except Exception:
+            self.close()
+            raise
+
+
+    @property
+    def alive(self):
+        """Boolean indicating if the shell process is running
+        """
+
+        return self._proc.poll() is None
+
+
+    @property
+    def pid(self):
+        return self._proc.pid
+
+
+    def submit(self, command):
+        """Send a command to the shell without waiting for it to finish.
+
+        Commands are run in the order submitted, and results must be
+        collected with :func:`receive` in the same order.  This allows
+        several shells to work at once.
+
+        :param command: the command to run
+        :type command: :class:`str`
+        """
+
+        script = '{ %s\n} </dev/null 2>&1\nprintf "\\n%s %%d\\n" $?\n' \
+                 % (command, self._marker)
+
+        try:
+            self._proc.stdin.write(script)
+            self._proc.stdin.flush()
+        except IOError as e:
+            raise ShellError('Shell died: %s' % e)
+
+        self._pending.append((command, time.time()))
+
+
+    def receive(self, name='shell'):
+        """Wait for the oldest submitted command to finish.
+
+        :param name: the timer name to record the time under (None to not record)
+        :returns: the result of the command
+        :rtype: :class:`Result`
+        :raises: :class:`ShellError` if the shell died
+        """
+
+        from .timer import TimeSpan
+
+        command, start = self._pending.pop(0)
+        lines = list()
+
+        while True:
+            line = self._proc.stdout.readline()
+            if not line:
+                raise ShellError('Shell died running {!r}'.format(command))
+            if line.startswith(self._marker):
+                break
+            lines.append(line)
+
+        stop = time.time()
+        ret = int(line.split()[1])
+        out = ''.join(lines)[:-1]  # drop the newline preceding the marker
+
+        if self._timer is not None and name is not None:
+            self._timer.record(name, start, stop, trial=self._trial)
+
+        span = TimeSpan(start, stop, trial=self._trial)
+        return Result(command=command, out=out, ret=ret, span=span)
+
+
+    def __call__(self, command, name='shell'):
+        """Run a command and wait for it to finish
+
+        :param command: the command to run
+        :param name: the timer name to record the time under (None to not record)
+        :rtype: :class:`Result`
+        """
+
+        self.submit(command)
+        return self.receive(name=name)
+
+
+    def check(self, command, name='shell'):
+        """Run a command, raising on a non-zero exit code
+
+        :rtype: :class:`Result`
+        :raises: :class:`ShellError`
+        """
+
+        result = self(command, name=name)
+        if result.ret != 0:
+            msg = '{!r} failed with {}: {}'.format(command, result.ret,
+                                                  result.out)
+            raise ShellError(msg, result=result)
+        return result
+
+
+    def close(self):
+        """Terminate the shell, closing its pipes even if it already
+        exited
+        """
+
+        try:
+            self._proc.stdin.close()
+        except IOError:
+            pass
+
+        self._proc.stdout.close()
+        self._proc.wait()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
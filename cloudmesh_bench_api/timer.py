@@ -1,14 +1,16 @@
 from collections import namedtuple, defaultdict
+import threading
 import time
 
 
 class TimeSpan(object):
 
-    __slots__ = ['start', 'stop']
+    __slots__ = ['start', 'stop', 'trial']
 
-    def __init__(self, start, stop):
+    def __init__(self, start, stop, trial=None):
         self.start = start
         self.stop = stop
+        self.trial = trial
 
     @property
     def seconds(self):
@@ -16,6 +18,33 @@ class TimeSpan(object):
 
 
 
+class Measurement(object):
+    """A single timing context, see :func:`Timer.measure`
+    """
+
+    __slots__ = ['timer', 'name', 'trial', 'start']
+
+    def __init__(self, timer, name, trial=None):
+        self.timer = timer
+        self.name = name
+        self.trial = trial
+        self.start = None
+
+
+    def __enter__(self):
+        if self.start is not None:
+            raise ValueError('Cannot enter an already running measurement')
+
+        self.timer._begin(self)
+        self.start = time.time()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stop = time.time()
+        self.timer._end(self, stop)
+
+
+
 class Timer(object):
     """
 
@@ -35,23 +64,23 @@ class Timer(object):
        print timer.average('foo')
        print timer.average('bar')
 
+    Measurements may be nested and may be taken from several threads
+    at once.
     """
 
 
     def __init__(self):
-        self._start = None
-        self._stop  = None
         self._order = list()
         self._times = defaultdict(list)
-        self._running = False
-        self._name = None
+        self._active = list()
+        self._lock = threading.Lock()
 
 
     @property
     def running(self):
         """Boolean indicated if the timer is current measuring something
         """
-        return self._running
+        return bool(self._active)
 
     @property
     def names(self):
@@ -61,10 +90,24 @@ class Timer(object):
         :rtype: generator
         """
 
-        assert set(self._times.keys()) == set(self._order), \
-            (self._times.key(), self._order)
+        with self._lock:
+            assert set(self._times.keys()) == set(self._order), \
+                (self._times.keys(), self._order)
+
+            return iter(list(self._order))
+
+
+    @property
+    def active(self):
+        """The measurements currently running
+
+        :returns: (name, trial, start) of each running measurement
+        :rtype: :class:`list` of :class:`tuple`
+        """
 
-        return iter(self._order)
+        with self._lock:
+            return [(m.name, m.trial, m.start) for m in self._active
+                    if m.start is not None]
 
 
     def times(self, name):
@@ -79,6 +122,39 @@ class Timer(object):
         return iter(self._times[name])
 
 
+    def spans(self, trial=None):
+        """Iterate over all the measured times in the order the names
+        were first measured.
+
+        :param trial: only yield spans measured during this trial (default: all)
+        :returns: iterable of (name, :class:`TimeSpan`) pairs
+        :rtype: generator
+        """
+
+        for name in self._order:
+            for span in self._times[name]:
+                if trial is None or span.trial == trial:
+                    yield name, span
+
+
+    def record(self, name, start, stop, trial=None):
+        """Add a measurement that was taken elsewhere, such as one
+        restored from a checkpoint.
+
+        :param name: the attribute to associate this measurement with
+        :param start: start time in seconds since the epoch
+        :param stop: stop time in seconds since the epoch
+        :param trial: the trial the measurement belongs to
+        """
+
+        span = TimeSpan(start=start, stop=stop, trial=trial)
+
+        with self._lock:
+            if name not in self._order:
+                self._order.append(name)
+            self._times[name].append(span)
+
+
     def average(self, name):
         """Return the average of the named time measurements
 
@@ -101,7 +177,7 @@ class Timer(object):
         return s / n
 
 
-    def measure(self, name):
+    def measure(self, name, trial=None):
         """Measure the time it takes to run arbitrary code.
 
         This creates a timing context under which the code is run.
@@ -116,32 +192,25 @@ class Timer(object):
 
         :param name: The attribute to associate this measurement with
         :type name: :class:`str`
+        :param trial: index of the trial this measurement belongs to
+        :type trial: :class:`int`
         """
-        self._name = name
-        return self
-
+        return Measurement(self, name, trial=trial)
 
-    def __enter__(self):
-        if self.running:
-            raise ValueError('Cannot enter an already running timer')
 
-        if self._name not in self._order:
-            self._order.append(self._name)
+    def _begin(self, measurement):
+        with self._lock:
+            if measurement.name not in self._order:
+                self._order.append(measurement.name)
+                self._times[measurement.name] = list()
+            self._active.append(measurement)
 
-        self._running = True
-        self._start = time.time()
 
+    def _end(self, measurement, stop):
+        span = TimeSpan(start = measurement.start,
+                        stop  = stop,
+                        trial = measurement.trial)
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        self._stop = time.time()
-
-        name = self._name
-        span = TimeSpan(start = self._start,
-                        stop  = self._stop)
-        self._times[name].append(span)
-
-        # cleanup
-        self._running = False
-        self._name = None
-        self._start = None
-        self._stop = None
+        with self._lock:
+            self._active.remove(measurement)
+            self._times[measurement.name].append(span)
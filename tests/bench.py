@@ -2,13 +2,20 @@
 
 from cloudmesh_bench_api.bench import AbstractBenchmarkRunner
 from cloudmesh_bench_api.bench import BenchmarkError
+from cloudmesh_bench_api.checkpoint import Checkpoint, FAILED
 from cloudmesh_bench_api.report import Report
+from cloudmesh_bench_api.noise import Isolation
+from cloudmesh_bench_api.metrics import MetricsServer
+from cloudmesh_bench_api.shell import Shell, ShellError
 
 from hypothesis import given, settings, assume
 from hypothesis import strategies as st
 
 import os
+import tempfile
+import threading
 import time
+import urllib2
 import string
 import random
 
@@ -45,6 +52,10 @@ class ExampleBenchmarkRunner(AbstractBenchmarkRunner):
         sleep()
         return dict()
 
+    def _generate_data(self, params):
+        sleep()
+        return True
+
     def _configure(self, node_count=1):
         if node_count < 1:
             raise BenchmarkError('Node count less than 1: {}'\
@@ -77,6 +88,7 @@ def filenames(draw):
     return name
 
 
+@settings(deadline=None)
 @given(filenames(),
        st.integers(min_value=1, max_value=5),
        st.integers(min_value=1))
@@ -98,6 +110,256 @@ def test_runners(prefix, times, node_count):
         (b._timer.keys(), list(b._timer.names))
 
 
+class Interrupted(Exception):
+    pass
+
+
+class CrashingBenchmarkRunner(ExampleBenchmarkRunner):
+
+    def __init__(self, crash_at=None, **kws):
+        super(CrashingBenchmarkRunner, self).__init__(**kws)
+        self.crash_at = crash_at
+        self.recovered = list()
+        self.runs = 0
+
+    def _run(self):
+        self.runs += 1
+
+    def _clean(self):
+        # dying before the trial is finished leaves it in the checkpoint
+        if self.runs - 1 == self.crash_at:
+            raise Interrupted()
+
+    def _recover(self, trial):
+        self.recovered.append(trial['index'])
+        super(CrashingBenchmarkRunner, self)._recover(trial)
+
+
+def test_resume():
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'checkpoint.json')
+    prefix = os.path.join(tmp, 'prefix')
+
+    b = CrashingBenchmarkRunner(prefix=prefix, checkpoint=path, crash_at=2)
+    assertRaises(Interrupted, lambda: b.bench(times=4))
+    assert b.runs == 3
+
+    # the checkpoint holds the environment, which may have secrets
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    b = CrashingBenchmarkRunner(prefix=prefix, checkpoint=path)
+    b.bench(times=4)
+    assert b.recovered == [2], b.recovered
+    assert b.runs == 2, b.runs
+    assert len(list(b._timer.times('run'))) == 4
+
+    # all trials are done, so nothing is run
+    b = CrashingBenchmarkRunner(prefix=prefix, checkpoint=path)
+    b.bench(times=4)
+    assert b.runs == 0
+    assert b.recovered == []
+
+    # a different configuration does not reuse the trials
+    b = CrashingBenchmarkRunner(prefix=prefix, checkpoint=path, node_count=2)
+    b.bench(times=1)
+    assert b.runs == 1
+
+
+class ShellBenchmarkRunner(ExampleBenchmarkRunner):
+
+    def _prepare(self):
+        return dict(GREETING='hello')
+
+    def _deploy(self):
+        self.shell('export DEPLOYED=yes')
+        self.shell('mkdir -p build && cd build')
+
+    def _run(self):
+        self.output = self.shell('echo $GREETING $DEPLOYED; pwd').out
+        self.status = self.shell('exit_code() { return 3; }; exit_code',
+                                 check=False).ret
+        assertRaises(BenchmarkError, lambda: self.shell('false'))
+
+
+def test_shell():
+
+    prefix = tempfile.mkdtemp()
+    b = ShellBenchmarkRunner(prefix=prefix)
+    b.bench(times=1)
+
+    greeting, pwd = b.output.strip().split('\n')
+    assert greeting == 'hello yes', greeting
+    assert pwd.endswith('build'), pwd
+    assert b.status == 3
+    assert len(list(b._timer.times('shell'))) == 5
+    assert b._shell is None
+
+
+def test_shell_cleanup():
+
+    fds = len(os.listdir('/proc/self/fd'))
+
+    for _ in xrange(3):
+        assertRaises(ShellError,
+                     lambda: Shell(files_to_source=['/does/not/exist']))
+    assert len(os.listdir('/proc/self/fd')) == fds
+
+    # e.g. a node that failed
+    shell = Shell()
+    assertRaises(ShellError, lambda: shell('exit', name=None))
+    shell.close()
+    assert not shell.alive
+    assert len(os.listdir('/proc/self/fd')) == fds
+
+
+class SlowBenchmarkRunner(ExampleBenchmarkRunner):
+
+    # fetching and preparing do not use the environment
+    environ_phases = AbstractBenchmarkRunner.environ_phases \
+                     - set(['fetch', 'prepare', 'dataset'])
+
+    def _fetch(self, prefix):
+        time.sleep(0.1)
+        return super(SlowBenchmarkRunner, self)._fetch(prefix)
+
+    def _prepare(self):
+        time.sleep(0.1)
+        return dict()
+
+    def _run(self):
+        time.sleep(0.2)
+
+
+def test_pipeline():
+
+    times = 4
+    b = SlowBenchmarkRunner(prefix=tempfile.mkdtemp())
+
+    start = time.time()
+    b.bench(times=times, lookahead=1)
+    elapsed = time.time() - start
+
+    spans = dict()
+    for name, span in b._timer.spans():
+        spans.setdefault(span.trial, dict())[name] = span
+
+    assert sorted(spans.keys()) == range(times)
+
+    # the cluster is used by one trial at a time, in order
+    for i in xrange(1, times):
+        assert spans[i]['launch'].start >= spans[i-1]['cleanup'].stop
+
+    # the next trial is fetched and prepared while the current one runs
+    assert spans[1]['prepare'].stop < spans[0]['cleanup'].stop
+    sequential = sum(span.seconds for _, span in b._timer.spans())
+    assert elapsed < sequential, (elapsed, sequential)
+
+
+class EnvBenchmarkRunner(ExampleBenchmarkRunner):
+
+    def __init__(self, *args, **kwargs):
+        super(EnvBenchmarkRunner, self).__init__(*args, **kwargs)
+        self.seen = dict()
+        self.seen_local = set()
+
+    def _sample(self):
+        for _ in xrange(5):
+            self.seen_local.update(k for k in os.environ
+                                   if k == 'TRIAL_ENV' or k.startswith('OWN_'))
+            time.sleep(0.01)
+
+    def _fetch(self, prefix):
+        self._sample()
+        return super(EnvBenchmarkRunner, self)._fetch(prefix)
+
+    def _prepare(self):
+        self._sample()
+        return {'TRIAL_ENV': str(self._trial),
+                'OWN_%d' % self._trial: '1'}
+
+    def _configure(self, node_count=1):
+        time.sleep(0.05)
+
+    def _run(self):
+        seen = self.seen.setdefault(self._trial, set())
+        for _ in xrange(10):
+            seen.add(os.environ['TRIAL_ENV'])
+            seen.update(k for k in os.environ if k.startswith('OWN_'))
+            time.sleep(0.01)
+
+
+def test_pipeline_env():
+
+    times = 4
+    b = EnvBenchmarkRunner(prefix=tempfile.mkdtemp())
+    b.bench(times=times, lookahead=2)
+
+    assert sorted(b.seen.keys()) == range(times)
+    for trial, seen in b.seen.items():
+        assert seen == set([str(trial), 'OWN_%d' % trial]), (trial, seen)
+    assert 'TRIAL_ENV' not in os.environ
+
+    # fetching and preparing never see the environment of another trial
+    assert not b.seen_local, b.seen_local
+
+
+class PipelineCrashRunner(SlowBenchmarkRunner):
+
+    def _run(self):
+        time.sleep(0.2)
+        raise Interrupted()
+
+
+def test_pipeline_crash():
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'checkpoint.json')
+    prefix = os.path.join(tmp, 'prefix')
+
+    b = PipelineCrashRunner(prefix=prefix, checkpoint=path)
+    assertRaises(Interrupted, lambda: b.bench(times=3, lookahead=1))
+
+    # the running trial and the one fetched ahead of it are both ended
+    checkpoint = Checkpoint(path)
+    assert [t['status'] for t in checkpoint.trials] == [FAILED, FAILED]
+    assert not checkpoint.interrupted()
+    assert not [d for d in os.listdir(prefix) if d.startswith('trial-')], \
+        os.listdir(prefix)
+
+
+def test_isolation():
+
+    b = ExampleBenchmarkRunner(prefix=tempfile.mkdtemp(),
+                               isolation=Isolation(interval=0.01))
+    b.bench(times=2)
+
+    noise = list(b.report.noise(header=False))
+    assert [row[0] for row in noise] == [0, 1]
+
+
+def test_metrics():
+
+    b = SlowBenchmarkRunner(prefix=tempfile.mkdtemp())
+
+    with MetricsServer(b) as server:
+        thread = threading.Thread(target=b.bench, kwargs=dict(times=3))
+        thread.start()
+
+        time.sleep(0.5)
+        during = urllib2.urlopen(server.url).read()
+        thread.join()
+        after = urllib2.urlopen(server.url).read()
+
+    assert 'bench_trials_total 3.0' in during, during
+    assert 'bench_phase_running_seconds{phase=' in during, during
+
+    assert 'bench_trials_completed 3.0' in after, after
+    assert 'bench_phase_seconds_count{phase="run"} 3' in after, after
+    assert 'bench_phase_seconds_bucket{phase="run",le="+Inf"} 3' in after, after
+    assert 'bench_eta_seconds 0.0' in after, after
+
+
 if __name__ == '__main__':
 
     test_runners()
@@ -0,0 +1,69 @@
+
+
+"""
+Cold-start import cost of the package.
+
+The budget (in seconds, on top of starting the interpreter) can be
+adjusted with the ``IMPORT_BUDGET`` environment variable.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = 'cloudmesh_bench_api.bench'
+HEAVY = ['numpy', 'pxul']
+BUDGET = float(os.environ.get('IMPORT_BUDGET', 0.05))
+REPEAT = 5
+
+
+def python(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+    cmd = [sys.executable, '-c', code]
+    return subprocess.check_output(cmd, env=env)
+
+
+def cold_start(code):
+    """The best wall time of starting a new interpreter running ``code``
+    """
+
+    best = float('inf')
+    for _ in xrange(REPEAT):
+        start = time.time()
+        python(code)
+        best = min(best, time.time() - start)
+    return best
+
+
+def test_no_heavy_imports():
+
+    code = '; '.join([
+        'import sys',
+        'import %s' % MODULE,
+        'print(",".join(sorted(sys.modules)))',
+    ])
+    modules = python(code).strip().split(',')
+    modules = set(m.split('.')[0] for m in modules)
+
+    loaded = modules.intersection(HEAVY)
+    assert not loaded, loaded
+
+
+def test_import_time():
+
+    baseline = cold_start('pass')
+    imported = cold_start('import %s' % MODULE)
+    overhead = imported - baseline
+
+    print 'import %s: %.3fs over %.3fs baseline' % (MODULE, overhead, baseline)
+    assert overhead < BUDGET, (overhead, BUDGET)
+
+
+if __name__ == '__main__':
+
+    test_no_heavy_imports()
+    test_import_time()
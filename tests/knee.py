@@ -0,0 +1,86 @@
+
+
+from cloudmesh_bench_api.knee import find_knee, search
+from cloudmesh_bench_api.timer import Timer
+from cloudmesh_bench_api.report import Report
+
+from hypothesis import given
+from hypothesis import strategies as st
+
+
+def amdahl(serial):
+    """Throughput of a fixed amount of work with a serial fraction"""
+    return lambda n: 1.0 / (serial + (1 - serial) / n)
+
+
+def efficiency(throughput, n):
+    return throughput(n) / n / throughput(1)
+
+
+@given(st.floats(min_value=0.001, max_value=0.5),
+       st.floats(min_value=0.2, max_value=0.9))
+def test_find_knee(serial, threshold):
+
+    throughput = amdahl(serial)
+    knee = find_knee(throughput, 1, 1024, threshold=threshold)
+
+    assert efficiency(throughput, knee.node_count) >= threshold
+    if knee.node_count < 1024:
+        assert knee.upper == knee.node_count + 1
+        assert efficiency(throughput, knee.upper) < threshold
+    assert len(knee.evaluations) <= 14, len(knee.evaluations)
+
+
+def test_tolerance():
+
+    knee = find_knee(amdahl(0.01), 1, 1024, threshold=0.5, tolerance=16)
+
+    assert knee.upper - knee.lower <= 16
+    assert knee.lower <= 100 < knee.upper
+
+
+class FakeRunner(object):
+
+    def __init__(self, node_count, data_params):
+        self.report = Report(Timer(), node_count=node_count)
+        self.report.set_work('run', data_params)
+        self.seconds = 1.0 + node_count / 100.0
+
+    def bench(self, times=1):
+        for trial in xrange(times):
+            self.report._timer.record('run', 0, self.seconds, trial=trial)
+
+
+def test_search():
+
+    knee = search(FakeRunner, 1, 512, data_params=lambda n: 10 * n,
+                  threshold=0.5)
+
+    # weak scaling: efficiency is 1.01 / (1 + n/100)
+    assert knee.node_count == 102, knee
+    assert [r.node_count for r in knee.reports] == list(knee.evaluations)
+
+
+class FailingRunner(FakeRunner):
+
+    def bench(self, times=1):
+        # e.g. a BenchmarkError while launching, caught by bench()
+        if self.report.node_count < 64:
+            super(FailingRunner, self).bench(times=times)
+
+
+def test_search_failure():
+
+    knee = search(FailingRunner, 1, 512, data_params=lambda n: 10 * n,
+                  threshold=0.5)
+
+    assert knee.node_count < 64 <= knee.upper, knee
+    assert knee.evaluations[512] == 0
+
+
+if __name__ == '__main__':
+
+    test_find_knee()
+    test_tolerance()
+    test_search()
+    test_search_failure()
@@ -0,0 +1,176 @@
+
+
+from cloudmesh_bench_api.bench import AbstractBenchmarkRunner
+from cloudmesh_bench_api.fanout import FanOut, FanOutError
+from cloudmesh_bench_api.local import LocalCluster
+from cloudmesh_bench_api.shell import ShellError
+from cloudmesh_bench_api import providers
+
+import errno
+import os
+import resource
+import tempfile
+import time
+
+
+def test_launch():
+
+    prefix = tempfile.mkdtemp()
+    start = time.time()
+
+    with LocalCluster(100, prefix, launch_latency=0.2) as cluster:
+        failed = cluster.launch()
+        elapsed = time.time() - start
+
+        assert not failed
+        assert len(cluster.nodes) == 100
+        assert elapsed < 100 * 0.2, elapsed
+
+        for i, node in enumerate(cluster.nodes):
+            out = cluster.run(node, 'echo $NODE_ID $NODE_COUNT; pwd').out
+            ident, pwd = out.strip().split('\n')
+            assert ident == '%d 100' % i, ident
+            assert pwd == cluster.path(node), pwd
+
+    assert not os.listdir(prefix)
+
+
+def test_failures():
+
+    prefix = tempfile.mkdtemp()
+
+    with LocalCluster(50, prefix, failure_rate=0.5, seed=42) as cluster:
+        failed = cluster.launch()
+        assert 0 < len(failed) < 50
+        assert len(cluster.nodes) + len(failed) == 50
+
+        node = cluster.nodes[0]
+        cluster.fail(node)
+        assert node in cluster.failed
+
+        try:
+            cluster.run(node, 'true')
+        except ShellError:
+            pass
+        else:
+            raise ValueError('Failed node {} ran a command'.format(node))
+
+
+def test_launch_out_of_files():
+
+    prefix = tempfile.mkdtemp()
+    fds = len(os.listdir('/proc/self/fd'))
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    cluster = LocalCluster(100, prefix)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (fds + 50, hard))
+    try:
+        cluster.launch()
+    except (OSError, IOError) as e:
+        assert e.errno == errno.EMFILE, e
+    else:
+        raise ValueError('Launched 100 nodes with {} files'.format(fds + 50))
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    # the shells started before running out were closed
+    assert len(os.listdir('/proc/self/fd')) == fds
+    cluster.terminate()
+    assert not os.listdir(prefix)
+
+
+class LocalBenchmarkRunner(AbstractBenchmarkRunner):
+
+    def __init__(self, **kws):
+        super(LocalBenchmarkRunner, self).__init__(provider_name=providers.local,
+                                                   **kws)
+        self.deployed = None
+
+    def _fetch(self, prefix):
+        path = os.path.join(prefix, 'local')
+        if not os.path.exists(path):
+            os.makedirs(path)
+        return path
+
+    def _prepare(self):
+        return dict()
+
+    def _generate_data(self, params):
+        return True
+
+    def _configure(self, node_count=1):
+        self._cluster = LocalCluster(node_count, os.path.join(self.path, 'nodes'))
+
+    def _launch(self):
+        self._cluster.launch()
+
+    def _connect(self, node):
+        return self._cluster.shell(node)
+
+    def _deploy(self):
+        self.deployed = self.fan_out('deploy.node',
+                                     lambda node, sh: sh.check('sleep 0.05'),
+                                     self._cluster.nodes)
+
+    def _run(self):
+        self.fan_out('run.node',
+                     lambda node, sh: sh.check('test $NODE_ID -lt 10'),
+                     self._cluster.nodes)
+
+    def _verify(self):
+        return True
+
+    def _clean(self):
+        self._cluster.terminate()
+
+
+def test_fan_out():
+
+    runner = LocalBenchmarkRunner(prefix=tempfile.mkdtemp(), node_count=200,
+                                  concurrency=50)
+    runner.bench(times=1)
+
+    deploy = list(runner._timer.times('deploy'))[0]
+    assert deploy.seconds < 200 * 0.05 / 4, deploy.seconds
+    assert len(list(runner._timer.times('deploy.node'))) == 200
+    assert len(runner.deployed.ok) == 200
+
+    # the failure of run is logged by bench
+    assert len(list(runner._timer.times('run.node'))) == 200
+
+
+def test_partial_failure():
+
+    calls = list()
+
+    def connect(node):
+        calls.append(node)
+        return node * 2
+
+    def fn(node, conn):
+        if node % 3 == 0:
+            raise ValueError(node)
+        return conn
+
+    with FanOut(connect=connect, concurrency=4) as fanout:
+        try:
+            fanout.map(fn, range(10))
+        except FanOutError as e:
+            result = e.result
+        else:
+            raise ValueError('FanOutError not raised')
+
+        assert result.failed == [0, 3, 6, 9]
+        assert result.results[4] == 8
+
+        fanout.map(fn, range(10), raise_on_failure=False)
+        assert sorted(calls) == range(10)
+
+
+if __name__ == '__main__':
+
+    test_launch()
+    test_failures()
+    test_launch_out_of_files()
+    test_fan_out()
+    test_partial_failure()
@@ -0,0 +1,39 @@
+
+
+from cloudmesh_bench_api.noise import Isolation, fingerprint
+from cloudmesh_bench_api.noise import get_affinity, set_affinity
+
+import os
+
+
+def test_fingerprint():
+
+    fp = fingerprint(interval=0.05)
+
+    assert set(fp.keys()) == set(['cpus', 'loadavg', 'governors', 'mhz',
+                                  'background'])
+    assert fp['cpus'] >= 1
+    assert fp['background'] is None or 0 <= fp['background'] <= 1
+
+
+def test_isolation():
+
+    affinity = get_affinity()
+    niceness = os.nice(0)
+
+    assert affinity is not None
+    cpu = max(affinity)
+
+    with Isolation(cpus=[cpu], priority=1)():
+        assert get_affinity() == set([cpu])
+
+    assert get_affinity() == affinity
+    assert os.nice(0) == niceness
+
+    assert set_affinity(affinity)
+
+
+if __name__ == '__main__':
+
+    test_fingerprint()
+    test_isolation()
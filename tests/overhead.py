@@ -0,0 +1,202 @@
+
+
+"""
+Microbenchmarks of the overhead the harness adds to the measurements.
+
+Each benchmark yields the best time (in seconds) per operation, which
+must be within an absolute threshold and, if a baseline is given,
+within a tolerance of the baseline.
+
+Running this module stores the results:
+
+    $ python tests/overhead.py overhead.json
+
+which can then be used as the baseline of later runs:
+
+    $ OVERHEAD_BASELINE=overhead.json py.test tests/overhead.py
+
+Environment variables:
+
+- ``OVERHEAD_BASELINE``: path to stored results to compare against
+- ``OVERHEAD_TOLERANCE``: allowed slowdown relative to the baseline (default 0.25)
+- ``OVERHEAD_MAX_SPANS``: largest number of spans to report on (default 10^5, up to 10^7)
+"""
+
+from cloudmesh_bench_api.bench import AbstractBenchmarkRunner, _env
+from cloudmesh_bench_api.timer import Timer
+from cloudmesh_bench_api.report import Report
+
+from timeit import default_timer
+import json
+import os
+import sys
+
+
+REPEAT = 5
+TOLERANCE = float(os.environ.get('OVERHEAD_TOLERANCE', 0.25))
+MAX_SPANS = int(float(os.environ.get('OVERHEAD_MAX_SPANS', 1e5)))
+SPANS = [n for n in [10**3, 10**4, 10**5, 10**6, 10**7] if n <= MAX_SPANS]
+PHASES = ['fetch', 'prepare', 'configure', 'launch', 'deploy', 'run', 'cleanup']
+
+
+# absolute limits in seconds per operation (per span for reports)
+THRESHOLDS = {
+    'timer.measure':    20e-6,
+    'report.rows':      5e-6,
+    'report.csv':       5e-6,
+    'report.pretty':    5e-6,
+    'report.histogram': 5e-6,
+    'report.drift':     10e-6,
+    'eval_bash':        0.5,
+    'env':              1e-3,
+}
+
+
+class NullBenchmarkRunner(AbstractBenchmarkRunner):
+
+    def _fetch(self, prefix): return prefix
+    def _prepare(self): return dict()
+    def _generate_data(self, params): return True
+    def _configure(self, node_count=1): pass
+    def _launch(self): pass
+    def _deploy(self): pass
+    def _run(self): pass
+    def _verify(self): return True
+    def _clean(self): pass
+
+
+def best(fn, number, repeat=REPEAT):
+    """The best time of calling ``fn()`` ``number`` times, per call
+    """
+
+    times = list()
+    for _ in xrange(repeat):
+        start = default_timer()
+        for _ in xrange(number):
+            fn()
+        times.append(default_timer() - start)
+
+    return min(times) / number
+
+
+def load_baseline():
+    path = os.environ.get('OVERHEAD_BASELINE')
+    if not path:
+        return dict()
+
+    with open(path) as fd:
+        return json.load(fd)
+
+
+def check(key, seconds, threshold):
+    baseline = load_baseline().get(key)
+    print '%-30s %12.3e s' % (key, seconds)
+
+    assert seconds < threshold, (key, seconds, threshold)
+
+    if baseline is not None:
+        limit = baseline * (1 + TOLERANCE)
+        assert seconds < limit, (key, seconds, baseline)
+
+
+################################################## benchmarks
+
+def bench_timer_measure():
+    timer = Timer()
+
+    def measure():
+        with timer.measure('foo'):
+            pass
+
+    yield 'timer.measure', best(measure, 10**4)
+
+
+def spans_timer(count):
+    timer = Timer()
+    for i in xrange(count):
+        name = PHASES[i % len(PHASES)]
+        timer.record(name, i, i + 0.5, trial=i // len(PHASES))
+    return timer
+
+
+def bench_report():
+    for count in SPANS:
+        report = Report(spans_timer(count))
+        repeat = max(1, REPEAT * 10**3 // count)
+
+        yield 'report.rows[%d]' % count, \
+            best(lambda: list(report.rows()), 1, repeat) / count
+        yield 'report.csv[%d]' % count, \
+            best(report.csv, 1, repeat) / count
+        yield 'report.pretty[%d]' % count, \
+            best(report.pretty, 1, repeat) / count
+        # only the spans of a single phase are binned
+        yield 'report.histogram[%d]' % count, \
+            best(lambda: list(report.histogram('run')), 1, repeat) \
+            / (count // len(PHASES))
+        yield 'report.drift[%d]' % count, \
+            best(lambda: list(report.drift()), 1, repeat) / count
+
+
+def bench_eval_bash():
+    runner = NullBenchmarkRunner()
+    yield 'eval_bash', best(lambda: runner.eval_bash([]), 10)
+
+
+def bench_env():
+    runner = NullBenchmarkRunner()
+    env = runner.eval_bash([])
+
+    def switch():
+        with _env(**env):
+            pass
+
+    yield 'env', best(switch, 100)
+
+
+BENCHMARKS = [bench_timer_measure, bench_report, bench_eval_bash, bench_env]
+
+
+def run_all():
+    results = dict()
+    for benchmark in BENCHMARKS:
+        for key, seconds in benchmark():
+            results[key] = seconds
+    return results
+
+
+################################################## tests
+
+def threshold(key):
+    return THRESHOLDS[key.split('[')[0]]
+
+
+def test_timer_measure():
+    for key, seconds in bench_timer_measure():
+        check(key, seconds, threshold(key))
+
+
+def test_report():
+    for key, seconds in bench_report():
+        check(key, seconds, threshold(key))
+
+
+def test_eval_bash():
+    for key, seconds in bench_eval_bash():
+        check(key, seconds, threshold(key))
+
+
+def test_env():
+    for key, seconds in bench_env():
+        check(key, seconds, threshold(key))
+
+
+if __name__ == '__main__':
+
+    results = run_all()
+    for key in sorted(results):
+        print '%-30s %12.3e s' % (key, results[key])
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
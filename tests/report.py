@@ -0,0 +1,204 @@
+
+
+from cloudmesh_bench_api.timer import Timer
+from cloudmesh_bench_api.report import Report, scaling, change_points
+
+import math
+import random
+
+
+def make_report(node_count, seconds, work=None):
+    timer = Timer()
+    for trial, s in enumerate(seconds):
+        timer.record('run', 0, s, trial=trial)
+    report = Report(timer, node_count=node_count)
+    if work is not None:
+        report.set_work('run', work)
+    return report
+
+
+def close(a, b):
+    return abs(a - b) < 1e-9
+
+
+def test_throughput():
+
+    report = make_report(4, [1.0, 3.0], work=100)
+    header, row = list(report.throughput())
+
+    row = dict(zip(header, row))
+    assert row['nodes'] == 4
+    assert close(row['mean'], 2.0)
+    assert close(row['node_seconds'], 8.0)
+    assert close(row['throughput'], 50.0)
+    assert close(row['throughput_per_node'], 12.5)
+
+    report = make_report(4, [1.0])
+    _, row = list(report.throughput())
+    assert math.isnan(row[4])
+
+
+def test_strong_scaling():
+
+    # fixed work: perfect scaling until 4 nodes
+    reports = [make_report(n, [8.0 / min(n, 4)], work=800) for n in [8, 1, 2, 4]]
+    rows = list(scaling(reports, 'run', header=False))
+
+    assert [r[0] for r in rows] == [1, 2, 4, 8]
+    speedups = [r[5] for r in rows]
+    efficiencies = [r[6] for r in rows]
+    assert all(close(a, b) for a, b in zip(speedups, [1, 2, 4, 4]))
+    assert all(close(a, b) for a, b in zip(efficiencies, [1, 1, 1, 0.5]))
+
+
+def test_weak_scaling():
+
+    # work grows with the nodes and the time stays the same
+    reports = [make_report(n, [2.0], work=100 * n) for n in [1, 2, 4]]
+    rows = list(scaling(reports, 'run', header=False))
+
+    assert all(close(r[6], 1.0) for r in rows)
+    assert all(close(r[5], r[0]) for r in rows)
+
+
+def test_rate():
+
+    assert close(make_report(1, [2.0, 6.0], work=100).rate('run'), 25.0)
+    assert close(make_report(1, [2.0, 6.0]).rate('run'), 0.25)
+    assert make_report(1, []).rate('run') is None
+    assert make_report(1, [1.0]).rate('launch') is None
+
+    # a run where the phase was never measured
+    reports = [make_report(n, [1.0 / n], work=100) for n in [1, 2]] + \
+              [make_report(4, [])]
+    rows = list(scaling(reports, 'run', header=False))
+    assert close(rows[1][5], 2.0)
+    assert rows[2][0] == 4 and all(math.isnan(v) for v in rows[2][1:])
+
+    # a phase too quick for the clock
+    report = make_report(2, [0.0, 0.0], work=100)
+    _, row = list(report.throughput())
+    assert row[2] == 0 and math.isnan(row[6]) and math.isnan(row[7])
+
+    rows = list(scaling([make_report(1, [1.0], work=100), report], 'run',
+                        header=False))
+    assert rows[1][1] == 0
+    assert all(math.isnan(v) for v in rows[1][4:])
+
+
+def test_noisy():
+
+    report = make_report(1, [1.0, 1.0, 5.0, 1.0])
+    quiet = dict(cpus=4, loadavg=[0.5, 0.5, 0.5], governors=['performance'],
+                 mhz=2400.0, background=0.01)
+    busy = dict(quiet, loadavg=[8.0, 8.0, 8.0], background=0.5)
+
+    for trial in xrange(4):
+        report.set_fingerprint(trial, busy if trial == 2 else quiet)
+    report.set_fingerprint(3, dict(quiet, governors=['powersave']))
+
+    assert report.noisy() == set([2])
+    assert report.noisy(governors=['performance']) == set([2, 3])
+    assert report.noisy(max_load=None, max_background=None) == set()
+
+    _, row = list(report.rows(exclude=report.noisy()))
+    assert row[1] == 3
+    assert close(row[4], 1.0)
+
+    flags = [r[-1] for r in report.noise(header=False)]
+    assert flags == [0, 0, 1, 0]
+
+
+def test_histogram():
+
+    report = make_report(1, [0.5, 1.5, 1.6, 2.5, 2.6, 2.7])
+    rows = list(report.histogram('run', bins=3, range=(0, 3), header=False))
+
+    assert [r[2] for r in rows] == [1, 2, 3]
+    assert close(rows[0][0], 0) and close(rows[-1][1], 3)
+
+
+def test_series_and_trend():
+
+    timer = Timer()
+    for trial in xrange(20):
+        # two spans per trial, slowing down by 0.1 s each trial
+        timer.record('run', 0, 1 + 0.1 * trial, trial=trial)
+        timer.record('run', 0, 1 + 0.1 * trial, trial=trial)
+    report = Report(timer)
+
+    rows = list(report.series('run', header=False))
+    assert [r[0] for r in rows] == range(20)
+    assert all(r[1] == 2 for r in rows)
+    assert close(rows[3][3], 1.3)
+
+    trend = report.trend('run')
+    assert close(trend['slope'], 0.1)
+    assert close(trend['intercept'], 1.0)
+    assert close(trend['r2'], 1.0)
+
+
+def test_change_points():
+
+    rng = random.Random(0)
+    values = [1 + rng.gauss(0, 0.05) for _ in xrange(50)] + \
+             [2 + rng.gauss(0, 0.05) for _ in xrange(30)] + \
+             [1.5 + rng.gauss(0, 0.05) for _ in xrange(40)]
+
+    assert change_points(values) == [50, 80]
+    assert change_points([1.0] * 100) == []
+
+    report = make_report(1, values)
+    assert report.change_points('run') == [50, 80]
+    assert report.change_points('run', exclude=set(range(40, 60))) == [60, 80]
+
+    _, row = list(report.drift())
+    assert row[-1] == '50/80', row
+
+
+def test_unmeasured():
+
+    report = make_report(1, [1.0, 2.0])
+
+    assert list(report.histogram('launch', header=False)) == []
+    assert list(report.series('launch', header=False)) == []
+    assert report.change_points('launch') == []
+    assert report.rate('launch') is None
+
+    # asking about the phase does not add it to the timer
+    assert list(report._timer.names) == ['run']
+    assert [r[0] for r in report.rows(header=False)] == ['run']
+
+
+def test_change_points_rounding():
+
+    # not exactly representable, so the sums have rounding error
+    for value in [0.1, 1.3, 1e-3, 1234.567]:
+        assert change_points([value] * 100) == [], value
+        assert change_points([value] * 60) == [], value
+
+    # timings from a coarse clock, without a shift
+    rng = random.Random(0)
+    values = [rng.choice([1.0, 1.01]) for _ in xrange(200)]
+    assert change_points(values) == []
+    values = [round(1 + rng.gauss(0, 0.002), 2) for _ in xrange(200)]
+    assert change_points(values) == []
+
+    # with a shift
+    values = [rng.choice([1.0, 1.01]) for _ in xrange(100)] + \
+             [rng.choice([1.5, 1.51]) for _ in xrange(100)]
+    assert change_points(values) == [100]
+
+
+if __name__ == '__main__':
+
+    test_throughput()
+    test_strong_scaling()
+    test_weak_scaling()
+    test_rate()
+    test_noisy()
+    test_histogram()
+    test_series_and_trend()
+    test_change_points()
+    test_unmeasured()
+    test_change_points_rounding()